@@ -0,0 +1 @@
+# Lets the tests import the nc-lite modules from the repository root
@@ -1,20 +1,42 @@
+import copy
+import csv
+import io
 import json
+import os
 import sys
 import threading
 
 import numpy as np
 import vtk
-from PyQt6.Qsci import QsciLexerJSON, QsciScintilla
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QAction, QColor
+from PyQt6.Qsci import QsciCommand, QsciLexerJSON, QsciScintilla
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
+from PyQt6.QtGui import QAction, QBrush, QColor
 from PyQt6.QtWidgets import (QApplication, QDialog, QDialogButtonBox,
-                             QFileDialog, QFormLayout, QFrame, QHBoxLayout,
-                             QLineEdit, QMainWindow, QPushButton, QSplitter,
+                             QDockWidget, QFileDialog, QFormLayout, QFrame,
+                             QHBoxLayout,
+                             QLineEdit, QMainWindow, QMessageBox,
+                             QPlainTextEdit, QPushButton, QSplitter,
                              QTreeWidget, QTreeWidgetItem, QVBoxLayout,
                              QWidget)
 from vtkmodules.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
+from vtkmodules.util.numpy_support import numpy_to_vtk, numpy_to_vtkIdTypeArray
+
+from nc_lite_core import (NXLOG_TABLE_COLUMNS, EditJournal, FieldIndex,
+                          TransformationResolver, UndoHistory,
+                          ValidationEngine, ValidationWorker,
+                          apply_json_changes, apply_transformation, diff_json,
+                          find_orphaned_journals, get_dataset_values,
+                          get_journal_path, get_node_name, get_picked_node,
+                          get_pixel_offsets, iter_text_chunks, journal_changes,
+                          lock_file, map_unchanged_nodes, parse_index_query,
+                          parse_nxlog_table, place_off_geometry, reformat_json,
+                          release_lock, replay_journal, validation_view)
 
 MAX_TOTAL_LIST_LEN = 1_000_000
+MAX_PICK_DRAG_PIXELS = 3  # Mouse movement up to which a press/release is a click
+
+VALIDATION_DELAY_MS = 300  # Quiet time after an edit before validating
+JOURNAL_FLUSH_INTERVAL_MS = 1000  # Upper bound on how long a record stays in memory
 
 
 def traverse_json(json_obj, condition_fn, action_fn, path=[]) -> None:
@@ -80,11 +102,43 @@ def check_cumulative_length(obj, max_len, current_len=0):
 
 
 class MainWindow(QMainWindow):
+    # Emitted from the autoformat worker thread: source text, result, error
+    autoformat_finished = pyqtSignal(str, str, str)
+    # Emitted from the validation worker thread: node ID -> problems
+    validation_finished = pyqtSignal(object)
+    # Emitted from the VTK window when a face is clicked: node ID, cell ID
+    geometry_picked = pyqtSignal(object, int)
+
     def __init__(self):
         super().__init__()
         self.init_ui()
         self.json_data_store = {}  # Add a data store for JSON data
         self.currently_selected_item = None  # Track the currently selected tree item
+        self.field_index = FieldIndex()  # Look up nodes by module, topic, source, ...
+        self.highlighted_items = {}  # Tree items highlighted by the last query
+        self.setting_editor_text = False  # True while the editor mirrors the model
+        self.undo_history = UndoHistory()
+        self.applying_history = False  # True while an undo or redo is applied
+
+        # Journal structural edits so a crashed session can be recovered
+        self.journal = EditJournal(get_journal_path())
+        self.journal_timer = QTimer(self)
+        self.journal_timer.timeout.connect(self.journal.flush)
+        self.journal_timer.start(JOURNAL_FLUSH_INTERVAL_MS)
+
+        # Validate edited nodes in the background once typing pauses
+        self.problems = {}  # Node ID -> list of (severity, message)
+        self.problem_entries = {}  # Node ID -> its entries in the problems panel
+        self.problem_count = 0
+        self.dirty_nodes = set()  # Node IDs to validate on the next run
+        self.validating_nodes = set()  # Node IDs submitted to the worker
+        self.validation_timer = QTimer(self)
+        self.validation_timer.setSingleShot(True)
+        self.validation_timer.setInterval(VALIDATION_DELAY_MS)
+        self.validation_timer.timeout.connect(self.run_validation)
+        self.validation_worker = ValidationWorker(
+            ValidationEngine(), self.validation_finished.emit
+        )
 
     def init_ui(self):
         self.tree_widget = CustomTreeWidget(self)
@@ -104,14 +158,39 @@ class MainWindow(QMainWindow):
         # Add the JSON editor to the container
         self.editor_layout.addWidget(self.json_editor)
 
+        # Create a container for the query box and the tree
+        self.tree_container = QWidget()
+        self.tree_layout = QVBoxLayout(self.tree_container)
+        self.tree_layout.setContentsMargins(0, 0, 0, 0)
+        self.tree_layout.setSpacing(0)
+
+        self.query_edit = QLineEdit(self.tree_container)
+        self.query_edit.setPlaceholderText("Query, e.g. module=f144 topic=motion")
+        self.query_edit.setClearButtonEnabled(True)
+        self.query_edit.returnPressed.connect(self.run_index_query)
+        self.tree_layout.addWidget(self.query_edit)
+        self.tree_layout.addWidget(self.tree_widget)
+
         splitter = QSplitter(Qt.Orientation.Horizontal)
-        splitter.addWidget(self.tree_widget)
+        splitter.addWidget(self.tree_container)
         splitter.addWidget(self.editor_container)  # Add the container to the splitter
 
         self.status_bar = self.statusBar()
 
         self.setCentralWidget(splitter)
 
+        # Problems panel listing validation results, linked to the tree
+        self.problems_list = QTreeWidget()
+        self.problems_list.setHeaderLabels(["Severity", "Item", "Message"])
+        self.problems_list.setRootIsDecorated(False)
+        self.problems_list.itemActivated.connect(self.on_problem_activated)
+        self.problems_list.itemClicked.connect(self.on_problem_activated)
+        self.problems_dock = QDockWidget("Problems", self)
+        self.problems_dock.setWidget(self.problems_list)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self.problems_dock)
+        self.validation_finished.connect(self.on_validation_finished)
+        self.geometry_picked.connect(self.on_geometry_picked)
+
         # Menu for loading and saving JSON
         menubar = self.menuBar()
         file_menu = menubar.addMenu("File")
@@ -140,6 +219,16 @@ class MainWindow(QMainWindow):
         )
         edit_menu.addAction(self.toggle_search_action)
 
+        undo_action = QAction("Undo", self)
+        undo_action.setShortcut("Ctrl+Z")
+        undo_action.triggered.connect(self.undo)
+        edit_menu.addAction(undo_action)
+
+        redo_action = QAction("Redo", self)
+        redo_action.setShortcut("Ctrl+Shift+Z")
+        redo_action.triggered.connect(self.redo)
+        edit_menu.addAction(redo_action)
+
         delete_action = QAction("Delete Selected Item", self)
         delete_action.setShortcut("Delete")
         delete_action.triggered.connect(self.delete_selected_item)
@@ -151,6 +240,10 @@ class MainWindow(QMainWindow):
         insert_nxlog.triggered.connect(self.insert_nxlog)
         insert_menu.addAction(insert_nxlog)
 
+        insert_nxlog_table = QAction("Insert NXlogs from Table...", self)
+        insert_nxlog_table.triggered.connect(self.insert_nxlog_table)
+        insert_menu.addAction(insert_nxlog_table)
+
         insert_string = QAction("Insert String", self)
         insert_string.triggered.connect(self.insert_string)
         insert_menu.addAction(insert_string)
@@ -161,11 +254,27 @@ class MainWindow(QMainWindow):
         autoformat_action.triggered.connect(self.autoformat_json)
         format_menu.addAction(autoformat_action)
 
+        self.compact_arrays_action = QAction("Compact Arrays", self)
+        self.compact_arrays_action.setCheckable(True)
+        self.compact_arrays_action.setChecked(False)
+        format_menu.addAction(self.compact_arrays_action)
+
+        validate_action = QAction("Validate JSON", self)
+        validate_action.setShortcut("F7")
+        validate_action.triggered.connect(self.validate_json)
+        format_menu.addAction(validate_action)
+        self.autoformat_finished.connect(self.on_autoformat_finished)
+
         view_menu = menubar.addMenu("View")
         render_off_geometry_action = QAction("Render OFF Geometry", self)
         render_off_geometry_action.triggered.connect(self.render_off_geometry)
         view_menu.addAction(render_off_geometry_action)
 
+        render_pixel_positions_action = QAction("Render Pixel Positions", self)
+        render_pixel_positions_action.triggered.connect(self.render_pixel_positions)
+        view_menu.addAction(render_pixel_positions_action)
+        view_menu.addAction(self.problems_dock.toggleViewAction())
+
         self.tree_widget.itemSelectionChanged.connect(self.on_item_selection_changed)
         self.json_editor.textChanged.connect(self.on_editor_text_changed)
 
@@ -201,6 +310,12 @@ class MainWindow(QMainWindow):
         self.json_editor.setMarginWidth(0, 0)
         self.json_editor.setAutoIndent(True)
 
+        # Undo is handled for the whole document, not per editor buffer
+        for command in (QsciCommand.Command.Undo, QsciCommand.Command.Redo):
+            editor_command = self.json_editor.standardCommands().find(command)
+            editor_command.setKey(0)
+            editor_command.setAlternateKey(0)
+
         # Set up bracket matching
         self.json_editor.setBraceMatching(QsciScintilla.BraceMatch.StrictBraceMatch)
         self.json_editor.setMatchedBraceBackgroundColor(QColor("#3c3c3c"))
@@ -238,8 +353,11 @@ class MainWindow(QMainWindow):
             try:
                 with open(file_name, "r") as file:
                     data = json.load(file)
-                self.tree_widget.clear()  # Clear existing items in the tree
+                self.clear_tree()  # Clear existing items in the tree
                 self.populate_tree(data, None)
+                # Journal the loaded content, the file may be overwritten later
+                self.journal.reset()
+                self.record_edit("reset", data=data)
                 self.tree_widget.setCurrentItem(self.tree_widget.topLevelItem(0))
             except json.JSONDecodeError as e:
                 # Handle invalid JSON
@@ -279,6 +397,8 @@ class MainWindow(QMainWindow):
                 "treeItem": tree_item,
             }
             self.json_data_store[id(tree_item)] = node_data
+            self.field_index.add(id(tree_item), json_object)
+            self.mark_dirty(tree_item)
 
             for child in json_object.get("children", []):
                 self.populate_tree(child, tree_item, node_data)
@@ -304,7 +424,7 @@ class MainWindow(QMainWindow):
                 )
                 if safe_to_render:
                     raw_json = json.dumps(json_data, indent=4)
-                    self.json_editor.setText(raw_json)
+                    self.set_editor_text(raw_json)
                 else:
                     self.status_bar.showMessage(
                         f"Display Error: Total length of lists exceeds {MAX_TOTAL_LIST_LEN}"
@@ -318,7 +438,13 @@ class MainWindow(QMainWindow):
             try:
                 updated_json = json.loads(self.json_editor.text())
                 node_data = self.json_data_store[id(self.currently_selected_item)]
+                old_json = node_data["data"]
+                changes = diff_json(old_json, updated_json)
                 node_data["data"] = updated_json
+                self.field_index.add(id(self.currently_selected_item), updated_json)
+                self.mark_dirty(self.currently_selected_item)
+                if self.currently_selected_item.parent():
+                    self.mark_dirty(self.currently_selected_item.parent())
                 if isinstance(updated_json, dict):
                     new_name = self._get_name(updated_json)
                 elif isinstance(updated_json, str):
@@ -327,7 +453,18 @@ class MainWindow(QMainWindow):
                     raise ValueError("Invalid JSON type")
                 self.currently_selected_item.setText(0, new_name)
 
-                # Clear current children of the tree item
+                # Clear current children of the tree item, remembering the
+                # validation results of those that are up to date
+                validated = {
+                    path: self.problems.get(id(child_item), [])
+                    for path, child_item in self.iter_subtree_items(
+                        self.currently_selected_item
+                    )
+                    if id(child_item) not in self.dirty_nodes
+                    and id(child_item) not in self.validating_nodes
+                }
+                for i in range(self.currently_selected_item.childCount()):
+                    self.forget_subtree(self.currently_selected_item.child(i))
                 self.currently_selected_item.takeChildren()
 
                 # Recursively add new children if they exist
@@ -335,12 +472,30 @@ class MainWindow(QMainWindow):
                     for child in updated_json.get("children", []):
                         self._add_tree_item(child, self.currently_selected_item)
 
+                # Only validate the children whose content changed
+                get_old_path = map_unchanged_nodes(changes)
+                for path, child_item in self.iter_subtree_items(
+                    self.currently_selected_item
+                ):
+                    old_path = get_old_path(path)
+                    if old_path in validated:
+                        self.dirty_nodes.discard(id(child_item))
+                        self.set_problems(id(child_item), validated[old_path])
+                self.update_problems_title()
+
                 # Update the entire JSON hierarchy
                 self.update_parent_node(
                     node_data["parent"], self.currently_selected_item, updated_json
                 )
                 self.clear_error_highlighting()
                 self.status_bar.showMessage("Looks good!")
+                # Record only what changed, not the whole selected subtree
+                if changes and not self.setting_editor_text:
+                    self.record_edit(
+                        "patch",
+                        path=self.get_item_path(self.currently_selected_item),
+                        changes=changes,
+                    )
 
             except json.JSONDecodeError as e:
                 # Handle invalid JSON
@@ -352,8 +507,9 @@ class MainWindow(QMainWindow):
         elif self.tree_widget.topLevelItemCount() == 0:
             try:
                 updated_json = json.loads(self.json_editor.text())
-                self.tree_widget.clear()  # Clear existing items in the tree
+                self.clear_tree()  # Clear existing items in the tree
                 self.populate_tree(updated_json, None)
+                self.record_edit("reset", data=updated_json)
                 self.clear_error_highlighting()
                 self.status_bar.showMessage("Looks good!")
             except json.JSONDecodeError as e:
@@ -363,6 +519,184 @@ class MainWindow(QMainWindow):
                     f"JSON Error: {e.msg} at line {e.lineno}, column {e.colno}"
                 )
 
+    def set_editor_text(self, text):
+        # Show model data in the editor without recording it as a user edit
+        self.setting_editor_text = True
+        try:
+            self.json_editor.setText(text)
+        finally:
+            self.setting_editor_text = False
+
+    def iter_subtree_items(self, tree_item, path=()):
+        # Yield (path, item) of all descendants, with paths relative to tree_item
+        for i in range(tree_item.childCount()):
+            child_item = tree_item.child(i)
+            yield path + (i,), child_item
+            yield from self.iter_subtree_items(child_item, path + (i,))
+
+    def get_item_path(self, tree_item):
+        # Child indices from the top-level item down to tree_item
+        path = []
+        parent_item = tree_item.parent()
+        while parent_item:
+            path.append(parent_item.indexOfChild(tree_item))
+            tree_item, parent_item = parent_item, parent_item.parent()
+        path.append(self.tree_widget.indexOfTopLevelItem(tree_item))
+        return path[::-1]
+
+    def record_edit(self, op, old=None, **fields):
+        if op == "patch":
+            self.journal.record(
+                op, path=fields["path"], changes=journal_changes(fields["changes"])
+            )
+        else:
+            self.journal.record(op, **fields)
+        if op == "reset":
+            self.undo_history.clear()
+        elif not self.applying_history:
+            data = {"patch": fields.get("changes"), "insert": fields.get("data")}
+            if not self.undo_history.push(op, fields["path"], data.get(op, old)):
+                self.report_undo_cleared()
+
+    def report_undo_cleared(self):
+        self.status_bar.showMessage(
+            "This edit cannot be undone, the undo history was cleared"
+        )
+
+    def get_item_by_path(self, path):
+        tree_item = self.tree_widget.topLevelItem(path[0])
+        for index in path[1:]:
+            if tree_item is None:
+                break
+            tree_item = tree_item.child(index)
+        return tree_item
+
+    def undo(self):
+        delta = self.undo_history.undo()
+        if delta is None:
+            self.status_bar.showMessage("Nothing to undo")
+            return
+        deltas = delta["deltas"] if delta["op"] == "group" else [delta]
+        for delta in reversed(deltas):
+            self.apply_delta(delta, reverse=True)
+
+    def redo(self):
+        delta = self.undo_history.redo()
+        if delta is None:
+            self.status_bar.showMessage("Nothing to redo")
+            return
+        deltas = delta["deltas"] if delta["op"] == "group" else [delta]
+        for delta in deltas:
+            self.apply_delta(delta)
+
+    def apply_delta(self, delta, reverse=False):
+        # Replay a delta through the regular edit paths so the tree, the
+        # journal, the index and validation all stay in sync
+        op, path = delta["op"], delta["path"]
+        if reverse:
+            op = {"insert": "delete", "delete": "insert"}.get(op, op)
+        if op == "insert":
+            # Inserting needs the parent, None stands for the top level
+            tree_item = self.get_item_by_path(path[:-1]) if len(path) > 1 else None
+            missing = len(path) > 1 and tree_item is None
+        else:
+            tree_item = self.get_item_by_path(path)
+            missing = tree_item is None or id(tree_item) not in self.json_data_store
+        if missing:
+            self.undo_history.clear()
+            self.status_bar.showMessage("Undo Error: the edited item no longer exists")
+            return
+
+        self.applying_history = True
+        try:
+            if op == "patch":
+                changes = [json.loads(change) for change in delta["data"]]
+                json_data = apply_json_changes(
+                    copy.deepcopy(self.json_data_store[id(tree_item)]["data"]),
+                    changes,
+                    reverse=reverse,
+                )
+                self.tree_widget.setCurrentItem(tree_item)
+                self.json_editor.setText(json.dumps(json_data, indent=4))
+            elif op == "delete":
+                self.tree_widget.setCurrentItem(tree_item)
+                self.delete_selected_item()
+            else:
+                self.insert_json_at(tree_item, path, json.loads(delta["data"]))
+        finally:
+            self.applying_history = False
+
+    def insert_json_at(self, parent_item, path, json_object):
+        index = path[-1]
+        if parent_item is None:
+            self.populate_tree(json_object, None)
+            tree_item = self.tree_widget.takeTopLevelItem(
+                self.tree_widget.topLevelItemCount() - 1
+            )
+            self.tree_widget.insertTopLevelItem(index, tree_item)
+        else:
+            parent_data = self.json_data_store[id(parent_item)]
+            parent_data["data"].setdefault("children", []).insert(index, json_object)
+            self._add_tree_item(json_object, parent_item)
+            tree_item = parent_item.takeChild(parent_item.childCount() - 1)
+            parent_item.insertChild(index, tree_item)
+            self.mark_dirty(parent_item)
+        self.record_edit("insert", path=path, data=json_object)
+        self.tree_widget.setCurrentItem(tree_item)
+
+    def recover_session(self):
+        # Offer the journals of crashed instances, other running instances
+        # keep theirs locked
+        for path in find_orphaned_journals(os.path.dirname(self.journal.path)):
+            lock = lock_file(path + ".lock")
+            if lock is None:
+                continue  # Another instance is recovering it
+            try:
+                recovered = self.recover_journal(path)
+            finally:
+                release_lock(lock, remove=not os.path.exists(path))
+            if recovered:
+                break
+
+    def recover_journal(self, path):
+        answer = QMessageBox.question(
+            self,
+            "Recover Session",
+            "nc-lite did not shut down cleanly. Recover the unsaved edits?",
+        )
+        if answer != QMessageBox.StandardButton.Yes:
+            os.remove(path)
+            return False
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                roots = replay_journal(file)
+        except (OSError, ValueError, LookupError) as e:
+            # Keep the only copy of the edits for manual recovery
+            corrupt_path = path + ".corrupt"
+            os.replace(path, corrupt_path)
+            self.status_bar.showMessage(
+                f"Recovery Error: {e}, the journal was kept as {corrupt_path}"
+            )
+            return False
+        self.clear_tree()
+        self.currently_selected_item = None
+        for root in roots:
+            self.populate_tree(root, None)
+        # Continue in this instance's journal before dropping the old one
+        self.journal.reset()
+        self.record_edit("reset", data=roots)
+        self.journal.flush()
+        os.remove(path)
+        self.tree_widget.setCurrentItem(self.tree_widget.topLevelItem(0))
+        self.status_bar.showMessage("Recovered previous session")
+        return True
+
+    def closeEvent(self, event):
+        # A clean shutdown leaves nothing to recover
+        self.journal_timer.stop()
+        self.journal.close(discard=True)
+        super().closeEvent(event)
+
     def highlight_error(self, line, col):
         # Clear previous highlights
         self.clear_error_highlighting()
@@ -380,16 +714,37 @@ class MainWindow(QMainWindow):
         )
 
     def autoformat_json(self):
-        try:
-            # Parse the current text as JSON
-            json_object = json.loads(self.json_editor.text())
-            # Pretty print the JSON
-            formatted_json = json.dumps(json_object, indent=4)
-            # Set the formatted JSON back to the editor
-            self.json_editor.setText(formatted_json)
-        except json.JSONDecodeError as e:
+        source_text = self.json_editor.text()
+        compact_arrays = self.compact_arrays_action.isChecked()
+
+        def format_worker():
+            # Reformat the token stream, the text is never parsed into objects
+            output = io.StringIO()
+            try:
+                reformat_json(
+                    iter_text_chunks(source_text),
+                    output.write,
+                    indent=4,
+                    compact_arrays=compact_arrays,
+                )
+            except ValueError as e:
+                self.autoformat_finished.emit(source_text, "", str(e))
+            else:
+                self.autoformat_finished.emit(source_text, output.getvalue(), "")
+
+        self.status_bar.showMessage("Formatting...")
+        threading.Thread(target=format_worker, daemon=True).start()
+
+    def on_autoformat_finished(self, source_text, formatted_json, error):
+        if error:
             # Handle invalid JSON, maybe show an error message
-            self.status_bar.showMessage(f"Invalid JSON: {e}")
+            self.status_bar.showMessage(f"Invalid JSON: {error}")
+        elif self.json_editor.text() != source_text:
+            self.status_bar.showMessage("Autoformat discarded, the text changed meanwhile")
+        else:
+            # Set the formatted JSON back to the editor
+            self.set_editor_text(formatted_json)
+            self.status_bar.showMessage("Looks good!")
 
     def _add_tree_item(self, json_object, parent_item):
         # Check if jsonObject is a dictionary
@@ -404,6 +759,8 @@ class MainWindow(QMainWindow):
                 "treeItem": tree_item,
             }
             self.json_data_store[id(tree_item)] = node_data
+            self.field_index.add(id(tree_item), json_object)
+            self.mark_dirty(tree_item)
 
             # Recursively add children
             for child in json_object.get("children", []):
@@ -446,6 +803,15 @@ class MainWindow(QMainWindow):
 
         item_to_delete = selected_items[0]
         parent_item = item_to_delete.parent()
+        node_data = self.json_data_store.get(id(item_to_delete))
+        self.record_edit(
+            "delete",
+            old=node_data["data"] if node_data else None,
+            path=self.get_item_path(item_to_delete),
+        )
+        self.forget_subtree(item_to_delete)
+        if parent_item:
+            self.mark_dirty(parent_item)
 
         # Remove the item from the tree
         if parent_item:
@@ -461,7 +827,6 @@ class MainWindow(QMainWindow):
             # If it's a top-level item
             index = self.tree_widget.indexOfTopLevelItem(item_to_delete)
             self.tree_widget.takeTopLevelItem(index)
-            del self.json_data_store[id(item_to_delete)]
 
             self.currently_selected_item = None
             self.tree_widget.setCurrentItem(self.tree_widget.topLevelItem(0))
@@ -502,6 +867,47 @@ class MainWindow(QMainWindow):
                 units_edit.text(),
             )
 
+    def insert_nxlog_table(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Add Skeleton Modules from Table")
+        layout = QVBoxLayout(dialog)
+
+        table_edit = QPlainTextEdit(dialog)
+        table_edit.setPlaceholderText(
+            "Paste a CSV/TSV table with columns: " + ", ".join(NXLOG_TABLE_COLUMNS)
+        )
+        layout.addWidget(table_edit)
+
+        def load_table_file():
+            file_name, _ = QFileDialog.getOpenFileName(
+                dialog, "Open Table File", "", "Table Files (*.csv *.tsv *.txt)"
+            )
+            if file_name:
+                with open(file_name, "r", newline="") as file:
+                    table_edit.setPlainText(file.read())
+
+        load_button = QPushButton("Load File...", dialog)
+        load_button.clicked.connect(load_table_file)
+        layout.addWidget(load_button)
+
+        # Dialog buttons
+        buttons = QDialogButtonBox(
+            QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel
+        )
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            try:
+                rows = parse_nxlog_table(table_edit.toPlainText())
+            except (ValueError, csv.Error) as e:
+                self.status_bar.showMessage(f"Table Error: {e}")
+                return
+            self.insert_nxlog_jsons(
+                [self.create_nxlog_json(**row) for row in rows]
+            )
+
     def insert_string(self):
         dialog = QDialog(self)
         dialog.setWindowTitle("Add Simple String")
@@ -540,8 +946,7 @@ class MainWindow(QMainWindow):
 
     def new_json(self):
         # Clear the current JSON data store and tree widget
-        self.json_data_store.clear()
-        self.tree_widget.clear()
+        self.clear_tree()
         self.currently_selected_item = None
 
         # Create initial JSON structure
@@ -549,12 +954,13 @@ class MainWindow(QMainWindow):
 
         # Populate the tree and the editor with the initial JSON
         self.populate_tree(initial_json, None)
+        self.journal.reset()
+        self.record_edit("reset", data=initial_json)
         # self.json_editor.setText(json.dumps(initial_json, indent=4))
         self.tree_widget.setCurrentItem(self.tree_widget.topLevelItem(0))
 
-    def insert_nxlog_json(self, name, module, source, topic, units):
-        # Construct the skeleton module JSON
-        skeleton_module = {
+    def create_nxlog_json(self, name, module, source, topic, units):
+        return {
             "name": name,
             "type": "group",
             "attributes": [{"name": "NX_class", "dtype": "string", "values": "NXlog"}],
@@ -569,6 +975,10 @@ class MainWindow(QMainWindow):
             ],
         }
 
+    def insert_nxlog_json(self, name, module, source, topic, units):
+        # Construct the skeleton module JSON
+        skeleton_module = self.create_nxlog_json(name, module, source, topic, units)
+
         # Insert into the currently selected JSON item
         if self.currently_selected_item:
             node_data = self.json_data_store.get(id(self.currently_selected_item))
@@ -577,13 +987,80 @@ class MainWindow(QMainWindow):
                 if "children" not in json_data:
                     json_data["children"] = []
                 json_data["children"].append(skeleton_module)
-                self.json_editor.setText(json.dumps(json_data, indent=4))
-                self.on_editor_text_changed()  # Update the editor and data store
+                self.record_edit(
+                    "insert",
+                    path=self.get_item_path(self.currently_selected_item)
+                    + [len(json_data["children"]) - 1],
+                    data=skeleton_module,
+                )
+                # Setting the text re-parses it and updates the data store
+                self.set_editor_text(json.dumps(json_data, indent=4))
         else:
             # If no item is selected, insert at the root level
+            self.record_edit(
+                "insert",
+                path=[self.tree_widget.topLevelItemCount()],
+                data=skeleton_module,
+            )
             self.populate_tree(skeleton_module, None)
             self.tree_widget.setCurrentItem(self.tree_widget.topLevelItem(0))
 
+    def insert_nxlog_jsons(self, skeleton_modules):
+        # Apply all modules to the data model and tree in one batch, then
+        # refresh the editor once without re-parsing its text
+        if not skeleton_modules:
+            return
+        if self.currently_selected_item:
+            node_data = self.json_data_store.get(id(self.currently_selected_item))
+            if not node_data or not isinstance(node_data["data"], dict):
+                self.status_bar.showMessage(
+                    "Insert Error: NXlogs can only be added to a group or module"
+                )
+                return
+            json_data = node_data["data"]
+            children = json_data.setdefault("children", [])
+            parent_path = self.get_item_path(self.currently_selected_item)
+            self.tree_widget.setUpdatesEnabled(False)
+            self.undo_history.begin_group()
+            try:
+                for skeleton_module in skeleton_modules:
+                    children.append(skeleton_module)
+                    self.record_edit(
+                        "insert",
+                        path=parent_path + [len(children) - 1],
+                        data=skeleton_module,
+                    )
+                    self._add_tree_item(skeleton_module, self.currently_selected_item)
+            finally:
+                undoable = self.undo_history.end_group()
+                self.tree_widget.setUpdatesEnabled(True)
+            self.mark_dirty(self.currently_selected_item)
+            self.json_editor.blockSignals(True)
+            try:
+                self.json_editor.setText(json.dumps(json_data, indent=4))
+            finally:
+                self.json_editor.blockSignals(False)
+        else:
+            # If no item is selected, insert at the root level
+            self.tree_widget.setUpdatesEnabled(False)
+            self.undo_history.begin_group()
+            try:
+                for skeleton_module in skeleton_modules:
+                    self.record_edit(
+                        "insert",
+                        path=[self.tree_widget.topLevelItemCount()],
+                        data=skeleton_module,
+                    )
+                    self.populate_tree(skeleton_module, None)
+            finally:
+                undoable = self.undo_history.end_group()
+                self.tree_widget.setUpdatesEnabled(True)
+            self.tree_widget.setCurrentItem(self.tree_widget.topLevelItem(0))
+        if undoable:
+            self.status_bar.showMessage(f"Inserted {len(skeleton_modules)} NXlogs")
+        else:
+            self.report_undo_cleared()
+
     def insert_simple_string(self, name):
         if self.currently_selected_item:
             node_data = self.json_data_store.get(id(self.currently_selected_item))
@@ -592,8 +1069,13 @@ class MainWindow(QMainWindow):
                 if "children" not in json_data:
                     json_data["children"] = []
                 json_data["children"].append(name)
-                self.json_editor.setText(json.dumps(json_data, indent=4))
-                self.on_editor_text_changed()
+                self.record_edit(
+                    "insert",
+                    path=self.get_item_path(self.currently_selected_item)
+                    + [len(json_data["children"]) - 1],
+                    data=name,
+                )
+                self.set_editor_text(json.dumps(json_data, indent=4))
         else:
             self.populate_tree(name, None)
             self.tree_widget.setCurrentItem(self.tree_widget.topLevelItem(0))
@@ -618,6 +1100,60 @@ class MainWindow(QMainWindow):
 
         return json_object
 
+    def clear_tree(self):
+        self.tree_widget.clear()
+        self.json_data_store.clear()
+        self.field_index.clear()
+        self.highlighted_items.clear()
+        self.problems.clear()
+        self.problem_entries.clear()
+        self.problems_list.clear()
+        self.problem_count = 0
+        self.update_problems_title()
+        self.dirty_nodes.clear()
+
+    def forget_subtree(self, tree_item):
+        # Drop the data, index entries and problems of items removed from the tree
+        self.json_data_store.pop(id(tree_item), None)
+        self.field_index.remove(id(tree_item))
+        self.highlighted_items.pop(id(tree_item), None)
+        self.set_problems(id(tree_item), [])
+        for i in range(tree_item.childCount()):
+            self.forget_subtree(tree_item.child(i))
+
+    def clear_query_highlights(self):
+        for tree_item in self.highlighted_items.values():
+            tree_item.setBackground(0, QBrush())
+        self.highlighted_items.clear()
+
+    def run_index_query(self):
+        self.clear_query_highlights()
+        text = self.query_edit.text().strip()
+        if not text:
+            self.status_bar.showMessage("")
+            return
+        try:
+            criteria = parse_index_query(text)
+        except ValueError as e:
+            self.status_bar.showMessage(f"Query Error: {e}")
+            return
+
+        highlight = QBrush(QColor("#FFD966"))
+        first_item = None
+        for node_id in self.field_index.query(criteria):
+            tree_item = self.json_data_store[node_id]["treeItem"]
+            tree_item.setBackground(0, highlight)
+            self.highlighted_items[node_id] = tree_item
+            # Reveal the match by expanding its ancestors
+            parent_item = tree_item.parent()
+            while parent_item:
+                parent_item.setExpanded(True)
+                parent_item = parent_item.parent()
+            first_item = first_item or tree_item
+        if first_item:
+            self.tree_widget.scrollToItem(first_item)
+        self.status_bar.showMessage(f"{len(self.highlighted_items)} matching items")
+
     def get_root_items(self):
         return [
             self.tree_widget.topLevelItem(i)
@@ -630,15 +1166,101 @@ class MainWindow(QMainWindow):
         )
         if file_name:
             json_data = self.build_json()
-            with open(file_name, "w") as file:
-                if compress:
-                    json.dump(json_data, file, separators=(',', ':'), ensure_ascii=False)
-                else:
-                    json.dump(json_data, file, indent=2)
+            # Write next to the target and swap it in, so a failed save never
+            # leaves a truncated file behind
+            temp_file_name = file_name + ".tmp"
+            try:
+                with open(temp_file_name, "w") as file:
+                    if compress:
+                        json.dump(json_data, file, separators=(',', ':'), ensure_ascii=False)
+                    elif self.compact_arrays_action.isChecked():
+                        reformat_json(
+                            json.JSONEncoder().iterencode(json_data),
+                            file.write,
+                            indent=2,
+                            compact_arrays=True,
+                        )
+                    else:
+                        json.dump(json_data, file, indent=2)
+                os.replace(temp_file_name, file_name)
+            except (OSError, ValueError) as e:
+                if os.path.exists(temp_file_name):
+                    os.remove(temp_file_name)
+                self.status_bar.showMessage(f"Save Error: {e}")
+                return
+            self.status_bar.showMessage(f"Saved {file_name}")
 
     def validate_json(self):
-        # Function to validate JSON data in the editor
-        pass
+        # Check every node, unchanged nodes are answered from the engine's memo
+        self.dirty_nodes.update(self.json_data_store)
+        self.problems_dock.show()
+        self.run_validation()
+
+    def mark_dirty(self, tree_item):
+        self.dirty_nodes.add(id(tree_item))
+        self.validation_timer.start()
+
+    def is_live_node(self, node_id):
+        node_data = self.json_data_store.get(node_id)
+        tree_item = node_data.get("treeItem") if node_data else None
+        try:
+            return tree_item is not None and tree_item.treeWidget() is self.tree_widget
+        except RuntimeError:  # The underlying Qt item has been deleted
+            return False
+
+    def run_validation(self):
+        self.validation_timer.stop()
+        batch = [
+            (node_id, validation_view(self.json_data_store[node_id]["data"]))
+            for node_id in self.dirty_nodes
+            if self.is_live_node(node_id)
+        ]
+        self.dirty_nodes.clear()
+        if batch:
+            self.validating_nodes.update(node_id for node_id, _ in batch)
+            self.validation_worker.submit(batch)
+
+    def on_validation_finished(self, results):
+        self.validating_nodes.difference_update(results)
+        for node_id, problems in results.items():
+            self.set_problems(node_id, problems if self.is_live_node(node_id) else [])
+        self.update_problems_title()
+
+    def set_problems(self, node_id, problems):
+        # Replace the panel entries of one node only, so a result batch costs
+        # its own size rather than the number of problems in the document
+        old_entries = self.problem_entries.pop(node_id, [])
+        for entry in old_entries:
+            self.problems_list.takeTopLevelItem(
+                self.problems_list.indexOfTopLevelItem(entry)
+            )
+        self.problem_count -= len(old_entries)
+        if not problems:
+            self.problems.pop(node_id, None)
+            return
+        self.problems[node_id] = problems
+        tree_item = self.json_data_store[node_id]["treeItem"]
+        entries = []
+        for severity, message in problems:
+            entry = QTreeWidgetItem(
+                self.problems_list, [severity, tree_item.text(0), message]
+            )
+            entry.setData(0, Qt.ItemDataRole.UserRole, node_id)
+            if severity == "error":
+                entry.setForeground(0, QBrush(QColor("#E06C75")))
+            entries.append(entry)
+        self.problem_entries[node_id] = entries
+        self.problem_count += len(entries)
+
+    def update_problems_title(self):
+        self.problems_dock.setWindowTitle(f"Problems ({self.problem_count})")
+
+    def on_problem_activated(self, entry, column=0):
+        node_id = entry.data(0, Qt.ItemDataRole.UserRole)
+        if self.is_live_node(node_id):
+            tree_item = self.json_data_store[node_id]["treeItem"]
+            self.tree_widget.setCurrentItem(tree_item)
+            self.tree_widget.scrollToItem(tree_item)
 
     def render_off_geometry(self):
         if not self.currently_selected_item:
@@ -656,9 +1278,130 @@ class MainWindow(QMainWindow):
             self.status_bar.showMessage("No geometries found in the selected item")
             return
 
-        actors = self.create_vtk_actors(geometries)
+        resolver = TransformationResolver(self.get_document_roots())
+        try:
+            for geometry in geometries:
+                # Remember which tree item every geometry came from, for picking
+                tree_item = self.get_tree_item_for_json_path(
+                    self.currently_selected_item, geometry["path"]
+                )
+                geometry["node_id"] = id(tree_item)
+                self.place_geometry(geometry, tree_item.parent(), resolver)
+            actors, pick_index = self.create_vtk_actors(geometries)
+        except (ValueError, TypeError) as e:
+            self.status_bar.showMessage(f"Geometry Error: {e}")
+            return
+
+        self.show_vtk_window(actors, pick_index)
+
+    def get_document_roots(self):
+        return [
+            self.json_data_store[id(item)]["data"]
+            for item in self.get_root_items()
+            if id(item) in self.json_data_store
+        ]
+
+    def get_nexus_path(self, tree_item):
+        names = []
+        while tree_item:
+            node_data = self.json_data_store.get(id(tree_item))
+            name = get_node_name(node_data["data"]) if node_data else None
+            if name:
+                names.append(name)
+            tree_item = tree_item.parent()
+        return "/" + "/".join(reversed(names))
+
+    def place_geometry(self, geometry, detector_item, resolver):
+        # Instance the shape at every pixel of the owning detector and move
+        # it along the detector's depends_on chain
+        detector_data = self.json_data_store.get(id(detector_item)) if detector_item else None
+        pixel_offsets = None
+        matrix = np.eye(4)
+        if detector_data and isinstance(detector_data["data"], dict):
+            detector = detector_data["data"]
+            pixel_offsets = get_pixel_offsets(detector)
+            matrix = resolver.resolve_group(detector, self.get_nexus_path(detector_item))
+        vertices, faces, winding_order = place_off_geometry(
+            np.asarray(geometry["vertices"], dtype=float).reshape(-1, 3),
+            np.asarray(geometry["faces"], dtype=np.int64).ravel(),
+            np.asarray(geometry["winding_order"], dtype=np.int64).ravel(),
+            pixel_offsets,
+            matrix,
+        )
+        geometry.update(vertices=vertices, faces=faces, winding_order=winding_order)
+
+    def render_pixel_positions(self):
+        if not self.currently_selected_item:
+            self.status_bar.showMessage("No item selected")
+            return
 
-        self.show_vtk_window(actors)
+        # Every group with pixel offsets below the selected item is a detector
+        detector_items = []
+        pending = [self.currently_selected_item]
+        while pending:
+            tree_item = pending.pop()
+            node_data = self.json_data_store.get(id(tree_item))
+            if node_data and isinstance(node_data["data"], dict):
+                if get_dataset_values(node_data["data"], "x_pixel_offset") is not None:
+                    detector_items.append(tree_item)
+            pending.extend(tree_item.child(i) for i in range(tree_item.childCount()))
+        if not detector_items:
+            self.status_bar.showMessage("No pixel offsets found in the selected item")
+            return
+
+        resolver = TransformationResolver(self.get_document_roots())
+        position_arrays = []
+        cell_starts = np.zeros(len(detector_items), dtype=np.int64)
+        pixel_count = 0
+        try:
+            for i, detector_item in enumerate(detector_items):
+                detector = self.json_data_store[id(detector_item)]["data"]
+                matrix = resolver.resolve_group(detector, self.get_nexus_path(detector_item))
+                positions = apply_transformation(matrix, get_pixel_offsets(detector))
+                cell_starts[i] = pixel_count
+                position_arrays.append(positions)
+                pixel_count += len(positions)
+        except (ValueError, TypeError) as e:
+            self.status_bar.showMessage(f"Transformation Error: {e}")
+            return
+
+        # One vertex cell per pixel
+        points = vtk.vtkPoints()
+        points.SetData(numpy_to_vtk(np.concatenate(position_arrays), deep=True))
+        vertices = vtk.vtkCellArray()
+        vertices.SetData(
+            numpy_to_vtkIdTypeArray(np.arange(pixel_count + 1, dtype=np.int64), deep=True),
+            numpy_to_vtkIdTypeArray(np.arange(pixel_count, dtype=np.int64), deep=True),
+        )
+        poly_data = vtk.vtkPolyData()
+        poly_data.SetPoints(points)
+        poly_data.SetVerts(vertices)
+
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(poly_data)
+        actor = vtk.vtkActor()
+        actor.SetMapper(mapper)
+        actor.GetProperty().SetPointSize(3)
+
+        pick_index = self.create_pick_index(
+            poly_data, cell_starts, [id(item) for item in detector_items]
+        )
+        self.show_vtk_window([actor], pick_index)
+        self.status_bar.showMessage(
+            f"Rendering {pixel_count} pixels of {len(detector_items)} detectors"
+        )
+
+    def get_tree_item_for_json_path(self, tree_item, path):
+        # Follow "children" indices from tree_item, stopping at the deepest
+        # tree item that contains the addressed node
+        for key, index in zip(path[::2], path[1::2]):
+            if key != "children" or not isinstance(index, int):
+                break
+            child_item = tree_item.child(index)
+            if child_item is None:
+                break
+            tree_item = child_item
+        return tree_item
 
     def get_off_geometries(self, json_obj):
         geometries = []
@@ -682,46 +1425,107 @@ class MainWindow(QMainWindow):
                 elif child.get("config", {}).get("name") == "winding_order":
                     winding_order = child["config"]["values"]
             if vertices and faces and winding_order:
-                geometries.append({"vertices": vertices, "faces": faces, "winding_order": winding_order})
+                geometries.append(
+                    {
+                        "vertices": vertices,
+                        "faces": faces,
+                        "winding_order": winding_order,
+                        "path": path,
+                    }
+                )
 
         traverse_json(json_obj, condition_fn, action_fn)
         return geometries
 
     def create_vtk_actors(self, geometries):
-        actors = []
+        # Merge all geometries into one poly data built from NumPy arrays.
+        # OFF faces are start offsets into winding_order, which is exactly
+        # VTK's offsets/connectivity cell layout.
+        vertex_arrays = []
+        connectivity_arrays = []
+        offset_arrays = []
+        cell_starts = np.zeros(len(geometries), dtype=np.int64)
+        vertex_count = 0
+        connectivity_count = 0
+        cell_count = 0
+        for i, geometry in enumerate(geometries):
+            vertices = np.asarray(geometry["vertices"], dtype=float).reshape(-1, 3)
+            faces = np.asarray(geometry["faces"], dtype=np.int64).ravel()
+            winding_order = np.asarray(geometry["winding_order"], dtype=np.int64).ravel()
+            # Broken offsets would make VTK read outside the arrays
+            if (
+                faces.size == 0
+                or winding_order.size == 0
+                or faces[0] != 0
+                or (np.diff(faces) < 3).any()
+                or len(winding_order) - faces[-1] < 3
+                or winding_order.min() < 0
+                or winding_order.max() >= len(vertices)
+            ):
+                raise ValueError("OFF faces, winding_order and vertices do not match")
+
+            cell_starts[i] = cell_count
+            vertex_arrays.append(vertices)
+            connectivity_arrays.append(winding_order + vertex_count)
+            offset_arrays.append(faces + connectivity_count)
+            vertex_count += len(vertices)
+            connectivity_count += len(winding_order)
+            cell_count += len(faces)
+        offset_arrays.append(np.array([connectivity_count], dtype=np.int64))
+
+        points = vtk.vtkPoints()
+        points.SetData(numpy_to_vtk(np.concatenate(vertex_arrays), deep=True))
+
+        polys = vtk.vtkCellArray()
+        polys.SetData(
+            numpy_to_vtkIdTypeArray(np.concatenate(offset_arrays), deep=True),
+            numpy_to_vtkIdTypeArray(np.concatenate(connectivity_arrays), deep=True),
+        )
 
-        for geometry in geometries:
-            vertices = np.array(geometry["vertices"])
-            faces = np.array(geometry["faces"])
-            winding_order = np.array(geometry["winding_order"])
+        poly_data = vtk.vtkPolyData()
+        poly_data.SetPoints(points)
+        poly_data.SetPolys(polys)
 
-            points = vtk.vtkPoints()
-            for vertex in vertices:
-                points.InsertNextPoint(vertex)
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(poly_data)
 
-            polys = vtk.vtkCellArray()
-            num_faces = len(faces)
-            for i in range(num_faces):
-                polys.InsertNextCell(4)
-                polys.InsertCellPoint(winding_order[4 * i])
-                polys.InsertCellPoint(winding_order[4 * i + 1])
-                polys.InsertCellPoint(winding_order[4 * i + 2])
-                polys.InsertCellPoint(winding_order[4 * i + 3])
+        actor = vtk.vtkActor()
+        actor.SetMapper(mapper)
 
-            poly_data = vtk.vtkPolyData()
-            poly_data.SetPoints(points)
-            poly_data.SetPolys(polys)
+        pick_index = self.create_pick_index(
+            poly_data, cell_starts, [geometry.get("node_id") for geometry in geometries]
+        )
+        return [actor], pick_index
 
-            mapper = vtk.vtkPolyDataMapper()
-            mapper.SetInputData(poly_data)
+    def create_pick_index(self, poly_data, cell_starts, node_ids):
+        # Prebuilt locator so picks do not test every cell of the scene
+        locator = vtk.vtkStaticCellLocator()
+        locator.SetDataSet(poly_data)
+        locator.BuildLocator()
 
-            actor = vtk.vtkActor()
-            actor.SetMapper(mapper)
-            actors.append(actor)
+        return {
+            "locator": locator,
+            # Cell IDs from cell_starts[i] on belong to node_ids[i]
+            "cell_starts": cell_starts,
+            "node_ids": node_ids,
+        }
 
-        return actors
+    def on_geometry_picked(self, node_id, cell_id):
+        if not self.is_live_node(node_id):
+            self.status_bar.showMessage(f"Picked cell {cell_id}, its item no longer exists")
+            return
+        tree_item = self.json_data_store[node_id]["treeItem"]
+        parent_item = tree_item.parent()
+        while parent_item:
+            parent_item.setExpanded(True)
+            parent_item = parent_item.parent()
+        self.tree_widget.setCurrentItem(tree_item)
+        self.tree_widget.scrollToItem(tree_item)
+        self.status_bar.showMessage(f"Picked cell {cell_id} of {tree_item.text(0)}")
+
+    def show_vtk_window(self, actors, pick_index=None):
+        main_window = self
 
-    def show_vtk_window(self, actors):
         class VTKWindow(QFrame):
             def __init__(self, parent=None):
                 super().__init__(parent)
@@ -744,9 +1548,39 @@ class MainWindow(QMainWindow):
                 style = vtk.vtkInteractorStyleTrackballCamera()
                 self.interactor.SetInteractorStyle(style)
 
+                if pick_index:
+                    self.picker = vtk.vtkCellPicker()
+                    self.picker.AddLocator(pick_index["locator"])
+                    self.picker.SetTolerance(0.0005)
+                    self.press_position = None
+                    self.interactor.AddObserver("LeftButtonPressEvent", self.on_press)
+                    self.interactor.AddObserver("LeftButtonReleaseEvent", self.on_release)
+
                 self.interactor.Initialize()
                 self.interactor.Start()
 
+            def on_press(self, interactor, event):
+                self.press_position = interactor.GetEventPosition()
+
+            def on_release(self, interactor, event):
+                # Only a click picks, dragging rotates the camera
+                x, y = interactor.GetEventPosition()
+                if self.press_position is None:
+                    return
+                press_x, press_y = self.press_position
+                self.press_position = None
+                if max(abs(x - press_x), abs(y - press_y)) > MAX_PICK_DRAG_PIXELS:
+                    return
+                if not self.picker.Pick(x, y, 0, self.renderer):
+                    return
+                cell_id = self.picker.GetCellId()
+                node_id = get_picked_node(
+                    pick_index["cell_starts"], pick_index["node_ids"], cell_id
+                )
+                if node_id is not None:
+                    # The signal delivers the pick on the GUI thread
+                    main_window.geometry_picked.emit(node_id, cell_id)
+
         def thread_window():
             self.vtk_window = VTKWindow()
             self.vtk_window.show()
@@ -827,6 +1661,7 @@ def main():
     app = QApplication(sys.argv)
     main_window = MainWindow()
     main_window.show()
+    main_window.recover_session()
     sys.exit(app.exec())
 
 
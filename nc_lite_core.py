@@ -0,0 +1,1560 @@
+"""
+Data model helpers of nc-lite that do not depend on Qt or VTK: the
+streaming JSON reformatter, NXlog table parsing, the field index, config
+validation, the undo history, NXtransformations resolution and the edit
+journal.
+"""
+import collections
+import csv
+import fnmatch
+import glob
+import hashlib
+import json
+import os
+import posixpath
+import queue
+import re
+import shlex
+import threading
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+FORMAT_LINE_WIDTH = 100  # Line width that compact arrays are wrapped at
+FORMAT_CHUNK_SIZE = 1 << 16  # Characters fed to the tokenizer at a time
+MAX_JSON_TOKEN_LEN = 1 << 20  # Longest unfinished literal the tokenizer buffers
+
+INDEX_FIELDS = ("module", "topic", "source", "nx_class", "name")
+INDEX_FIELD_ALIASES = {"class": "nx_class", "nxclass": "nx_class", "writer": "module"}
+
+STREAM_MODULES = (
+    "ad00", "al00", "ep00", "ep01", "ev42", "ev44", "f142", "f144",
+    "hs00", "hs01", "ns10", "se00", "senv", "tdct",
+)
+STATIC_MODULES = ("dataset", "link", "mdat")
+MAX_VALIDATION_MEMO = 200_000  # Cached results kept by the validation engine
+
+UNDO_MEMORY_BUDGET = 64 * 1024 * 1024  # Characters of serialised deltas kept for undo/redo
+UNDO_COALESCE_SECONDS = 1.0  # Editor edits to one node within this time are merged
+
+UNIT_SCALES = {
+    # Lengths in metres
+    "m": 1.0, "metre": 1.0, "meter": 1.0, "cm": 1e-2, "mm": 1e-3,
+    "um": 1e-6, "micron": 1e-6, "nm": 1e-9,
+    # Angles in radians
+    "rad": 1.0, "radian": 1.0, "radians": 1.0,
+    "deg": np.pi / 180, "degree": np.pi / 180, "degrees": np.pi / 180,
+}
+PIXEL_OFFSET_NAMES = ("x_pixel_offset", "y_pixel_offset", "z_pixel_offset")
+
+NXLOG_TABLE_COLUMNS = ("name", "module", "source", "topic", "units")
+NXLOG_TABLE_REQUIRED_COLUMNS = ("name", "module", "source", "topic")
+
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".nc_lite")
+JOURNAL_FSYNC_BATCH = 64  # Pending records that force an fsync
+JOURNAL_COMPACT_THRESHOLD = 2000  # Records appended before a background compaction
+
+
+JSON_TOKEN_RE = re.compile(
+    r'[ \t\n\r]*(?:([{}\[\]:,])'
+    r'|("(?:[^"\\\x00-\x1f]|\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4}))*")'
+    r'|([^ \t\n\r{}\[\]:,"]+))'
+)
+# NaN and Infinity are not JSON, but Python's json module reads and writes them
+JSON_LITERAL_RE = re.compile(
+    r"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?|true|false|null"
+    r"|NaN|-?Infinity"
+)
+
+
+def iter_text_chunks(text, chunk_size=FORMAT_CHUNK_SIZE):
+    """
+    Split a string into chunks for iter_json_tokens.
+
+    :param text: The text to split.
+    :param chunk_size: Maximum number of characters per chunk.
+    """
+    for start in range(0, len(text), chunk_size):
+        yield text[start : start + chunk_size]
+
+
+def chain_end(iterable):
+    """
+    Yield the items of iterable followed by a single None end marker.
+    """
+    yield from iterable
+    yield None
+
+
+def iter_json_tokens(chunks):
+    """
+    Tokenize JSON text arriving in chunks, without building any objects.
+
+    Only the current token is buffered across chunk boundaries. Strings and
+    punctuation end themselves and are yielded as soon as they are complete,
+    only a literal touching the end of a chunk waits for the next one.
+    Unfinished literals are limited to MAX_JSON_TOKEN_LEN, unfinished strings
+    are only limited by the input.
+
+    :param chunks: Iterable of text chunks, e.g. from JSONEncoder.iterencode.
+    :return: Generator of (kind, text, offset) tuples where kind is one of
+        "punct", "string" or "literal".
+    """
+    buffer = ""
+    offset = 0  # Position of the buffer start within the whole text
+    string_chunks = []  # Chunks inside a string that is still open
+    for chunk in chain_end(chunks):
+        final = chunk is None
+        if not final:
+            if buffer.lstrip().startswith('"') and '"' not in chunk:
+                # The open string cannot end in this chunk, skip matching it
+                string_chunks.append(chunk)
+                continue
+            buffer += "".join(string_chunks) + chunk
+        else:
+            buffer += "".join(string_chunks)
+        string_chunks.clear()
+        pos = 0
+        while True:
+            match = JSON_TOKEN_RE.match(buffer, pos)
+            if not match:
+                break
+            punct, string, literal = match.groups()
+            # A literal touching the end of the buffer may continue in the next chunk
+            if literal and match.end() == len(buffer) and not final:
+                break
+            if punct:
+                yield "punct", punct, offset + match.start(1)
+            elif string:
+                yield "string", string, offset + match.start(2)
+            else:
+                if not JSON_LITERAL_RE.fullmatch(literal):
+                    raise ValueError(
+                        f"Invalid literal {literal[:20]!r} at position {offset + match.start(3)}"
+                    )
+                yield "literal", literal, offset + match.start(3)
+            pos = match.end()
+        offset += pos
+        buffer = buffer[pos:]
+        if final and buffer.strip():
+            raise ValueError(f"Invalid or unterminated token at position {offset}")
+        if len(buffer) > MAX_JSON_TOKEN_LEN and not buffer.lstrip().startswith('"'):
+            raise ValueError(f"Invalid or unterminated token at position {offset}")
+
+
+class JsonReformatter:
+    """
+    Re-indent a JSON token stream, checking its syntax along the way.
+
+    With compact_arrays, arrays that fit on the rest of the line are written
+    inline and the scalars and short arrays of longer arrays are filled into
+    lines of at most width characters, so large numeric arrays (and arrays
+    of vectors) take a handful of lines instead of one line per element.
+    Only a line's worth of tokens is looked ahead.
+    """
+
+    def __init__(self, tokens, write, indent=4, compact_arrays=False,
+                 width=FORMAT_LINE_WIDTH):
+        self.tokens = iter(tokens)
+        self.lookahead = collections.deque()
+        self.write_fn = write
+        self.indent = indent
+        self.compact_arrays = compact_arrays
+        self.width = width
+        self.column = 0
+        self.inline = False
+
+    def next(self):
+        if self.lookahead:
+            return self.lookahead.popleft()
+        token = next(self.tokens, None)
+        if token is None:
+            raise ValueError("Unexpected end of JSON")
+        return token
+
+    def peek(self, index=0):
+        while len(self.lookahead) <= index:
+            token = next(self.tokens, None)
+            if token is None:
+                return None
+            self.lookahead.append(token)
+        return self.lookahead[index]
+
+    def write(self, text):
+        self.write_fn(text)
+        self.column += len(text)
+
+    def newline(self, level):
+        self.write_fn("\n")
+        self.column = 0
+        self.write(" " * (self.indent * level))
+
+    def format(self):
+        self.value(0, self.next())
+        extra = self.peek()
+        if extra is not None:
+            raise ValueError(f"Extra data at position {extra[2]}")
+
+    def value(self, level, token):
+        kind, text, offset = token
+        if text == "{" and kind == "punct":
+            self.object(level)
+        elif text == "[" and kind == "punct":
+            self.array(level)
+        elif kind != "punct":
+            self.write(text)
+        else:
+            raise ValueError(f"Unexpected '{text}' at position {offset}")
+
+    def expect(self, expected):
+        kind, text, offset = self.next()
+        if kind != "punct" or text not in expected:
+            raise ValueError(
+                f"Expected {' or '.join(expected)} at position {offset}, got {text[:20]}"
+            )
+        return text
+
+    def inline_length(self, limit):
+        # Length of the array just opened when written on one line, None if
+        # it is longer than limit or holds objects. Only looks ahead that far.
+        length = 1
+        depth = 1
+        index = 0
+        while length <= limit:
+            token = self.peek(index)
+            if token is None or token[1] == "{" and token[0] == "punct":
+                return None
+            kind, text, _ = token
+            if kind == "punct" and text == "[":
+                depth += 1
+            elif kind == "punct" and text == "]":
+                depth -= 1
+                if depth == 0:
+                    return length + 1 if length < limit else None
+            length += 2 if text == "," and kind == "punct" else len(text)
+            index += 1
+        return None
+
+    def array(self, level):
+        token = self.peek()
+        if token and token[0] == "punct" and token[1] == "]":
+            self.next()
+            self.write("[]")
+            return
+        was_inline = self.inline
+        self.inline = was_inline or (
+            self.compact_arrays
+            and self.inline_length(self.width - self.column) is not None
+        )
+        self.write("[")
+        first = True
+        filling = False  # Whether the previous element was filled into a line
+        while True:
+            token = self.next()
+            length = None
+            if self.compact_arrays and not self.inline:
+                if token[0] != "punct":
+                    length = len(token[1])
+                elif token[1] == "[":
+                    width = self.width - self.indent * (level + 1)
+                    length = self.inline_length(width)
+            if self.inline:
+                if not first:
+                    self.write(", ")
+            elif length is not None and filling:
+                # Fill scalars and short arrays into the current line while
+                # they and a comma fit
+                if self.column + length + 3 <= self.width:
+                    self.write(", ")
+                else:
+                    self.write(",")
+                    self.newline(level + 1)
+            else:
+                if not first:
+                    self.write(",")
+                self.newline(level + 1)
+            filling = length is not None
+            self.value(level + 1, token)
+            first = False
+            if self.expect((",", "]")) == "]":
+                break
+        if not self.inline:
+            self.newline(level)
+        self.write("]")
+        self.inline = was_inline
+
+    def object(self, level):
+        token = self.peek()
+        if token and token[0] == "punct" and token[1] == "}":
+            self.next()
+            self.write("{}")
+            return
+        self.write("{")
+        first = True
+        while True:
+            if not first:
+                self.write(",")
+            self.newline(level + 1)
+            kind, text, offset = self.next()
+            if kind != "string":
+                raise ValueError(f"Expected property name at position {offset}")
+            self.write(text)
+            self.expect((":",))
+            self.write(": ")
+            self.value(level + 1, self.next())
+            first = False
+            if self.expect((",", "}")) == "}":
+                break
+        self.newline(level)
+        self.write("}")
+
+
+def reformat_json(chunks, write, indent=4, compact_arrays=False):
+    """
+    Stream-reformat JSON text without parsing it into Python objects.
+
+    :param chunks: Iterable of JSON text chunks.
+    :param write: Callable receiving the formatted output piece by piece.
+    :param indent: Number of spaces per indentation level.
+    :param compact_arrays: Keep arrays inline or wrapped instead of one element per line.
+    """
+    JsonReformatter(iter_json_tokens(chunks), write, indent, compact_arrays).format()
+
+
+def parse_nxlog_table(text):
+    """
+    Parse a CSV/TSV table of NXlog definitions, e.g. pasted from a spreadsheet.
+
+    The delimiter is a tab if the first line contains one, else a semicolon
+    if it contains one, else a comma. If the first row only contains column
+    names it is used as header, otherwise the columns are taken in the order
+    of NXLOG_TABLE_COLUMNS. Every row needs a value in each of the
+    NXLOG_TABLE_REQUIRED_COLUMNS, the units are optional.
+
+    :param text: The raw table text.
+    :return: A list of dicts keyed by the NXLOG_TABLE_COLUMNS names.
+    :raises ValueError: If the header or a row lacks a required column.
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return []
+    # Spreadsheet pastes are tab separated and semicolons are used where the
+    # comma is the decimal separator, so either wins over commas in the cells
+    delimiter = next((char for char in "\t;" if char in lines[0]), ",")
+    rows = [
+        [cell.strip() for cell in row] for row in csv.reader(lines, delimiter=delimiter)
+    ]
+
+    columns = list(NXLOG_TABLE_COLUMNS)
+    first_row_number = 1
+    header = [cell.lower() for cell in rows[0]]
+    if set(header) <= set(NXLOG_TABLE_COLUMNS):
+        missing = [name for name in NXLOG_TABLE_REQUIRED_COLUMNS if name not in header]
+        if missing:
+            raise ValueError(f"Table header has no {', '.join(missing)} column")
+        columns = header
+        rows = rows[1:]
+        first_row_number = 2
+
+    entries = []
+    for row_number, row in enumerate(rows, first_row_number):
+        if len(row) > len(columns):
+            raise ValueError(f"Row {row_number} has more than {len(columns)} columns")
+        entry = dict.fromkeys(NXLOG_TABLE_COLUMNS, "")
+        entry.update(zip(columns, row))
+        missing = [name for name in NXLOG_TABLE_REQUIRED_COLUMNS if not entry[name]]
+        if missing:
+            raise ValueError(f"Row {row_number} has no {', '.join(missing)}")
+        entries.append(entry)
+    return entries
+
+
+def get_attribute(json_obj, name, default=None):
+    """
+    Get an attribute of a group or dataset node.
+
+    Attributes may be given as a list of {"name": ..., "values": ...} dicts
+    or as a plain {name: value} dict.
+
+    :param json_obj: A JSON node (dict).
+    :param name: The attribute name, e.g. "NX_class".
+    :param default: Returned if the node has no such attribute.
+    :return: The attribute value or default.
+    """
+    attributes = json_obj.get("attributes")
+    if isinstance(attributes, dict):
+        return attributes.get(name, default)
+    if isinstance(attributes, list):
+        for attribute in attributes:
+            if isinstance(attribute, dict) and attribute.get("name") == name:
+                return attribute.get("values", default)
+    return default
+
+
+def get_nx_class(json_obj):
+    """
+    Get the NX_class attribute of a group, if it has one.
+
+    :param json_obj: A JSON node (dict).
+    :return: The NX_class value or None.
+    """
+    return get_attribute(json_obj, "NX_class")
+
+
+def get_node_name(json_obj):
+    """
+    Get the name a node has in the NeXus file, i.e. its path component.
+
+    :param json_obj: A JSON node.
+    :return: The group or dataset name, or None for unnamed nodes.
+    """
+    if not isinstance(json_obj, dict):
+        return None
+    name = json_obj.get("name")
+    if name is None and "module" in json_obj:
+        config = json_obj.get("config")
+        name = config.get("name") if isinstance(config, dict) else None
+    return name if isinstance(name, str) and name else None
+
+
+def get_index_fields(json_obj):
+    """
+    Extract the values of the indexed fields from a single JSON node.
+
+    Only the node itself is inspected, not its children, so a node's entries
+    in the index only change when the node itself is edited.
+
+    :param json_obj: A JSON node.
+    :return: Dict mapping field names from INDEX_FIELDS to string values.
+    """
+    if not isinstance(json_obj, dict):
+        return {}
+    config = json_obj.get("config")
+    if not isinstance(config, dict):
+        config = {}
+    values = {
+        "module": json_obj.get("module"),
+        "topic": config.get("topic"),
+        "source": config.get("source"),
+        "nx_class": get_nx_class(json_obj),
+        "name": json_obj.get("name", config.get("name")),
+    }
+    return {
+        field: value
+        for field, value in values.items()
+        if isinstance(value, (str, int, float)) and value != ""
+    }
+
+
+def parse_index_query(text):
+    """
+    Parse a query such as 'module=f144 topic=motion' into field criteria.
+
+    Terms without a field name match the node name. Values may contain the
+    shell-style wildcards * and ?, and may be quoted to contain spaces.
+
+    :param text: The query text.
+    :return: Dict mapping field names to the requested values.
+    """
+    criteria = {}
+    for term in shlex.split(text):
+        field, separator, value = term.partition("=")
+        if not separator:
+            field, value = "name", term
+        field = field.strip().lower()
+        field = INDEX_FIELD_ALIASES.get(field, field)
+        if field not in INDEX_FIELDS:
+            raise ValueError(
+                f"Unknown field '{field}', use one of: {', '.join(INDEX_FIELDS)}"
+            )
+        criteria[field] = value
+    return criteria
+
+
+class FieldIndex:
+    """
+    Secondary index from module type, topic, source, NX_class and name to node IDs.
+
+    Node IDs are the json_data_store keys. Nodes are added and removed one
+    at a time as the tree changes, so the index never needs a full rebuild.
+    """
+
+    def __init__(self):
+        self.postings = {field: collections.defaultdict(set) for field in INDEX_FIELDS}
+        self.node_fields = {}
+
+    def clear(self):
+        for postings in self.postings.values():
+            postings.clear()
+        self.node_fields.clear()
+
+    def add(self, node_id, json_obj):
+        self.remove(node_id)
+        fields = get_index_fields(json_obj)
+        if fields:
+            self.node_fields[node_id] = fields
+            for field, value in fields.items():
+                self.postings[field][str(value)].add(node_id)
+
+    def remove(self, node_id):
+        fields = self.node_fields.pop(node_id, None)
+        if not fields:
+            return
+        for field, value in fields.items():
+            node_ids = self.postings[field][str(value)]
+            node_ids.discard(node_id)
+            if not node_ids:
+                del self.postings[field][str(value)]
+
+    def lookup(self, field, pattern):
+        postings = self.postings[field]
+        if not any(char in pattern for char in "*?["):
+            return postings.get(pattern, set())
+        # Wildcards only scan the distinct values, not the nodes
+        matches = set()
+        for value in fnmatch.filter(postings.keys(), pattern):
+            matches |= postings[value]
+        return matches
+
+    def query(self, criteria):
+        if not criteria:
+            return set()
+        results = sorted(
+            (self.lookup(field, value) for field, value in criteria.items()), key=len
+        )
+        return set(results[0]).intersection(*results[1:])
+
+
+VALIDATION_RULES = []
+
+
+def validation_rule(*kinds):
+    """
+    Register a validation rule for the given node kinds (see get_node_kinds).
+
+    A rule takes a node, whose children are stripped of their own children,
+    and yields (severity, message) tuples for every problem it finds.
+    """
+
+    def register(check_fn):
+        VALIDATION_RULES.append((kinds, check_fn))
+        return check_fn
+
+    return register
+
+
+def get_node_kinds(json_obj):
+    """
+    Classify a JSON node for rule dispatch.
+
+    :param json_obj: A JSON node.
+    :return: Tuple of kinds, e.g. ("module", "module:f144") or ("group", "class:NXlog").
+    """
+    if not isinstance(json_obj, dict):
+        return ()
+    kinds = []
+    if "module" in json_obj:
+        kinds += ["module", f"module:{json_obj['module']}"]
+    if json_obj.get("type") == "group":
+        kinds.append("group")
+        nx_class = get_nx_class(json_obj)
+        if nx_class:
+            kinds.append(f"class:{nx_class}")
+        if json_obj.get("name") == "pixel_shape" or nx_class == "NXoff_geometry":
+            kinds.append("off_geometry")
+    return tuple(kinds)
+
+
+def get_child_modules(json_obj):
+    return [
+        child
+        for child in json_obj.get("children", [])
+        if isinstance(child, dict) and "module" in child
+    ]
+
+
+def get_dataset_values(json_obj, name):
+    """
+    Get the values of the dataset child with the given name.
+
+    :param json_obj: A group node.
+    :param name: The dataset name, e.g. "vertices".
+    :return: The dataset values or None if there is no such dataset.
+    """
+    for child in get_child_modules(json_obj):
+        config = child.get("config")
+        if isinstance(config, dict) and config.get("name") == name:
+            return config.get("values")
+    return None
+
+
+@validation_rule("module")
+def check_module_name(json_obj):
+    module = json_obj["module"]
+    if module not in STREAM_MODULES and module not in STATIC_MODULES:
+        yield "error", f"Unknown module '{module}'"
+    if not isinstance(json_obj.get("config"), dict):
+        yield "error", "Module has no 'config' object"
+
+
+@validation_rule(*(f"module:{module}" for module in STREAM_MODULES))
+def check_stream_config(json_obj):
+    config = json_obj.get("config")
+    if not isinstance(config, dict):
+        return
+    for key in ("source", "topic"):
+        value = config.get(key)
+        if not isinstance(value, str) or not value.strip():
+            yield "error", f"Module '{json_obj['module']}' is missing '{key}'"
+
+
+@validation_rule("module:dataset", "module:link", "module:mdat")
+def check_static_config(json_obj):
+    config = json_obj.get("config")
+    if not isinstance(config, dict):
+        return
+    required = {"dataset": ("name", "values"), "link": ("name", "source"), "mdat": ("name",)}
+    for key in required[json_obj["module"]]:
+        if key not in config or config[key] in ("", None):
+            yield "error", f"Module '{json_obj['module']}' is missing '{key}'"
+
+
+@validation_rule("group")
+def check_group(json_obj):
+    if not json_obj.get("name"):
+        yield "error", "Group has no name"
+    if not isinstance(json_obj.get("children", []), list):
+        yield "error", "Group 'children' must be a list"
+    if get_nx_class(json_obj) is None:
+        yield "warning", "Group has no NX_class attribute"
+
+
+@validation_rule("class:NXlog")
+def check_nxlog(json_obj):
+    modules = [
+        child for child in get_child_modules(json_obj)
+        if child["module"] in STREAM_MODULES
+    ]
+    if not modules and get_dataset_values(json_obj, "value") is None:
+        yield "warning", "NXlog has neither a stream module nor a 'value' dataset"
+
+
+@validation_rule("off_geometry")
+def check_off_geometry(json_obj):
+    datasets = {
+        name: get_dataset_values(json_obj, name)
+        for name in ("vertices", "faces", "winding_order")
+    }
+    missing = [name for name, values in datasets.items() if values is None]
+    if missing:
+        yield "error", f"OFF geometry is missing {', '.join(missing)}"
+        return
+    try:
+        vertices = np.asarray(datasets["vertices"], dtype=float)
+        faces = np.asarray(datasets["faces"], dtype=np.int64)
+        winding_order = np.asarray(datasets["winding_order"], dtype=np.int64)
+    except (ValueError, TypeError):
+        yield "error", "OFF geometry datasets must be numeric arrays"
+        return
+    if vertices.ndim != 2 or vertices.shape[1] != 3:
+        yield "error", "OFF vertices must be a list of [x, y, z] points"
+    if faces.ndim != 1 or winding_order.ndim != 1:
+        yield "error", "OFF faces and winding_order must be flat lists"
+        return
+    if winding_order.size and (
+        winding_order.min() < 0 or winding_order.max() >= len(vertices)
+    ):
+        yield "error", "OFF winding_order refers to vertices that do not exist"
+    if not faces.size:
+        yield "error", "OFF geometry has no faces"
+        return
+    # faces holds the start index of every face within winding_order
+    face_sizes = np.diff(np.append(faces, len(winding_order)))
+    if faces[0] != 0 or (face_sizes < 3).any():
+        yield "error", (
+            f"OFF faces/winding_order mismatch: {len(faces)} faces do not "
+            f"partition the {len(winding_order)} winding_order entries"
+        )
+
+
+def compile_validation_rules(rules):
+    """
+    Build a dispatch table from node kind to the checks that apply to it.
+
+    :param rules: List of (kinds, check_fn) tuples as registered by validation_rule.
+    :return: Dict mapping each kind to a tuple of check functions.
+    """
+    dispatch = collections.defaultdict(tuple)
+    for kinds, check_fn in rules:
+        for kind in kinds:
+            dispatch[kind] += (check_fn,)
+    return dispatch
+
+
+def validation_view(json_obj):
+    """
+    Shallow copy of a node with grandchildren removed, the input of the rules.
+
+    Taken on the UI thread so the validation worker never sees a children
+    list that is being modified.
+
+    :param json_obj: A JSON node.
+    """
+    if not isinstance(json_obj, dict) or "children" not in json_obj:
+        return json_obj
+    view = dict(json_obj)
+    children = json_obj["children"]
+    if isinstance(children, list):
+        view["children"] = [
+            {key: value for key, value in child.items() if key != "children"}
+            if isinstance(child, dict)
+            else child
+            for child in children
+        ]
+    return view
+
+
+class ValidationEngine:
+    """
+    Rule-based validation of module configs and NeXus group structure.
+
+    Rules are compiled once into a dispatch table by node kind. Results are
+    memoised by the content hash of a node, so nodes that are unchanged since
+    the last run (or identical to another node) are not checked again.
+    """
+
+    def __init__(self, rules=VALIDATION_RULES):
+        self.dispatch = compile_validation_rules(rules)
+        self.checks_by_kinds = {}
+        self.memo = {}
+
+    def checks_for(self, json_obj):
+        kinds = get_node_kinds(json_obj)
+        checks = self.checks_by_kinds.get(kinds)
+        if checks is None:
+            checks = tuple(
+                dict.fromkeys(check for kind in kinds for check in self.dispatch[kind])
+            )
+            self.checks_by_kinds[kinds] = checks
+        return checks
+
+    def validate_node(self, view):
+        problems = []
+        for check_fn in self.checks_for(view):
+            problems.extend(check_fn(view))
+        return problems
+
+    def run(self, batch):
+        """
+        Validate a batch of nodes.
+
+        :param batch: List of (node_id, view) tuples.
+        :return: Dict mapping node_id to a list of (severity, message) tuples.
+        """
+        if len(self.memo) > MAX_VALIDATION_MEMO:
+            self.memo.clear()
+        results = {}
+        for node_id, view in batch:
+            content = json.dumps(view, separators=(",", ":"), default=str)
+            key = hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+            problems = self.memo.get(key)
+            if problems is None:
+                problems = self.memo[key] = self.validate_node(view)
+            results[node_id] = problems
+        return results
+
+
+class ValidationWorker:
+    """
+    Background thread running a ValidationEngine on submitted batches.
+    """
+
+    def __init__(self, engine, callback):
+        self.engine = engine
+        self.callback = callback
+        self.batches = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, batch):
+        self.batches.put(batch)
+
+    def _run(self):
+        while True:
+            batch = self.batches.get()
+            try:
+                results = self.engine.run(batch)
+            except Exception as e:  # A broken rule must not kill the worker
+                problem = ("error", f"Validation failed: {e}")
+                results = {node_id: [problem] for node_id, _ in batch}
+            self.callback(results)
+
+
+class UndoHistory:
+    """
+    Document-level undo/redo stack of structural deltas.
+
+    A delta records the operation ("patch", "insert" or "delete"), the tree
+    path it applies to and its serialised data: the changes made by diff_json
+    for a patch, the subtree for an insert or delete. The oldest deltas are
+    dropped once the deltas together exceed memory_budget characters, and
+    patches of the same node in quick succession (typing) are merged into one
+    delta. Deltas pushed between begin_group and end_group are undone as one
+    step.
+    """
+
+    def __init__(self, memory_budget=UNDO_MEMORY_BUDGET,
+                 coalesce_seconds=UNDO_COALESCE_SECONDS):
+        self.memory_budget = memory_budget
+        self.coalesce_seconds = coalesce_seconds
+        self.undo_stack = collections.deque()
+        self.redo_stack = []
+        self.size = 0
+        self.group = None
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.size = 0
+        self.group = None
+
+    def begin_group(self):
+        self.group = []
+
+    def end_group(self):
+        """
+        Close the group opened by begin_group.
+
+        :return: False if the group could not be recorded, see push.
+        """
+        deltas, self.group = self.group, None
+        if not deltas:
+            return True
+        if any(delta is None for delta in deltas):
+            self.clear()
+            return False
+        return self._append(
+            {
+                "op": "group",
+                "deltas": deltas,
+                "time": time.monotonic(),
+                "size": sum(delta["size"] for delta in deltas),
+            }
+        )
+
+    def push(self, op, path, data):
+        """
+        Record an edit that has just been applied to the document.
+
+        :param op: "patch", "insert" or "delete".
+        :param path: Tree path of the patched, inserted or deleted node.
+        :param data: The changes from diff_json for a patch, the inserted or
+            deleted subtree otherwise.
+        :return: False if the edit cannot be undone, because it is larger than
+            the memory budget or its data is missing. The history is cleared
+            then, as older edits cannot be undone without undoing it first.
+        """
+        if data is None:
+            if self.group is not None:
+                self.group.append(None)
+            else:
+                self.clear()
+            return False
+        for delta in self.redo_stack:
+            self.size -= delta["size"]
+        self.redo_stack.clear()
+
+        now = time.monotonic()
+        if op == "patch":
+            data = [json.dumps(change, separators=(",", ":")) for change in data]
+            size = sum(len(change) for change in data)
+        else:
+            data = json.dumps(data, separators=(",", ":"))
+            size = len(data)
+        top = self.undo_stack[-1] if self.undo_stack else None
+        if (
+            self.group is None
+            and op == "patch"
+            and top is not None
+            and top["op"] == "patch"
+            and top["path"] == path
+            and now - top["time"] < self.coalesce_seconds
+        ):
+            top["data"].extend(data)
+            top["size"] += size
+            top["time"] = now
+            self.size += size
+            return self._evict()
+
+        delta = {"op": op, "path": list(path), "data": data, "time": now, "size": size}
+        if self.group is not None:
+            self.group.append(delta)
+            return True
+        return self._append(delta)
+
+    def _append(self, delta):
+        self.undo_stack.append(delta)
+        self.size += delta["size"]
+        return self._evict()
+
+    def _evict(self):
+        if self.undo_stack[-1]["size"] > self.memory_budget:
+            self.clear()
+            return False
+        # Never evict the newest delta, that is the one undo needs
+        while len(self.undo_stack) > 1 and self.size > self.memory_budget:
+            self.size -= self.undo_stack.popleft()["size"]
+        return True
+
+    def undo(self):
+        if not self.undo_stack:
+            return None
+        delta = self.undo_stack.pop()
+        self.redo_stack.append(delta)
+        if self.undo_stack:
+            self.undo_stack[-1]["time"] = float("-inf")
+        return delta
+
+    def redo(self):
+        if not self.redo_stack:
+            return None
+        delta = self.redo_stack.pop()
+        self.undo_stack.append(delta)
+        # The redone edit must not absorb the next keystroke
+        delta["time"] = float("-inf")
+        return delta
+
+
+def get_unit_scale(units, default):
+    """
+    Get the factor converting a value in the given units to metres or radians.
+
+    :param units: The units string, or None to use default.
+    :param default: Units assumed when none are given.
+    """
+    units = default if units is None else str(units).strip()
+    if units not in UNIT_SCALES:
+        raise ValueError(f"Unsupported units '{units}'")
+    return UNIT_SCALES[units]
+
+
+def get_transformation_value(json_obj):
+    """
+    Get the magnitude of a transformation, taking the first value of arrays.
+
+    Streamed transformations (e.g. an NXlog of a motor) use their "value"
+    dataset if it has one, and 0 otherwise.
+    """
+    if "module" in json_obj:
+        config = json_obj.get("config")
+        values = config.get("values") if isinstance(config, dict) else None
+    else:
+        values = get_dataset_values(json_obj, "value")
+    values = np.asarray(values if values is not None else 0.0, dtype=float).ravel()
+    return values[0] if values.size else 0.0
+
+
+def transformation_matrix(json_obj):
+    """
+    Compute the 4x4 matrix of a single NXtransformations entry.
+
+    Following NeXus, the offset is applied after the translation or rotation
+    along vector, i.e. M = T(offset) @ T(vector * value) or T(offset) @ R(vector, value).
+
+    :param json_obj: The transformation node (dataset or group).
+    :return: A 4x4 NumPy array.
+    """
+    transformation_type = get_attribute(json_obj, "transformation_type")
+    vector = np.asarray(get_attribute(json_obj, "vector", [0, 0, 1]), dtype=float).ravel()
+    norm = np.linalg.norm(vector)
+    if vector.shape != (3,) or norm == 0:
+        raise ValueError(f"Invalid transformation vector {vector.tolist()}")
+    vector = vector / norm
+    units = get_attribute(json_obj, "units")
+    value = get_transformation_value(json_obj)
+
+    matrix = np.eye(4)
+    if transformation_type == "translation":
+        matrix[:3, 3] = vector * value * get_unit_scale(units, "m")
+    elif transformation_type == "rotation":
+        angle = value * get_unit_scale(units, "deg")
+        # Rodrigues' rotation formula
+        cross = np.array(
+            [
+                [0, -vector[2], vector[1]],
+                [vector[2], 0, -vector[0]],
+                [-vector[1], vector[0], 0],
+            ]
+        )
+        matrix[:3, :3] = np.eye(3) + np.sin(angle) * cross + (1 - np.cos(angle)) * cross @ cross
+    else:
+        raise ValueError(f"Unknown transformation_type '{transformation_type}'")
+
+    offset = get_attribute(json_obj, "offset")
+    if offset is not None:
+        offset_matrix = np.eye(4)
+        offset_scale = get_unit_scale(get_attribute(json_obj, "offset_units"), "m")
+        offset_matrix[:3, 3] = np.asarray(offset, dtype=float).ravel()[:3] * offset_scale
+        matrix = offset_matrix @ matrix
+    return matrix
+
+
+class TransformationResolver:
+    """
+    Resolve depends_on chains of NXtransformations into 4x4 matrices.
+
+    The resolved matrix of every transformation is memoised by its absolute
+    path, so a chain tail shared by many detectors (e.g. the instrument or
+    a common stage) is computed only once.
+    """
+
+    def __init__(self, roots):
+        self.nodes = {}
+        self.matrices = {}
+        self.resolving = set()
+        for root in roots:
+            self._add_paths(root, "")
+
+    def _add_paths(self, json_obj, parent_path):
+        name = get_node_name(json_obj)
+        path = f"{parent_path}/{name}" if name else parent_path
+        if name:
+            self.nodes[path] = json_obj
+        for child in json_obj.get("children", []) if isinstance(json_obj, dict) else []:
+            self._add_paths(child, path)
+
+    def resolve(self, depends_on, base_path):
+        """
+        Get the matrix mapping local coordinates into the global frame.
+
+        :param depends_on: The depends_on value, absolute or relative to base_path.
+        :param base_path: Path of the group holding the depends_on field.
+        :return: A 4x4 NumPy array.
+        """
+        if depends_on in (None, "", "."):
+            return np.eye(4)
+        if not isinstance(depends_on, str):
+            raise ValueError(f"Invalid depends_on value {depends_on!r}")
+        path = posixpath.normpath(posixpath.join(base_path or "/", depends_on))
+        matrix = self.matrices.get(path)
+        if matrix is not None:
+            return matrix
+        node = self.nodes.get(path)
+        if node is None:
+            raise ValueError(f"depends_on target '{path}' does not exist")
+        if path in self.resolving:
+            raise ValueError(f"depends_on cycle at '{path}'")
+        self.resolving.add(path)
+        try:
+            parent_matrix = self.resolve(
+                get_attribute(node, "depends_on"), posixpath.dirname(path)
+            )
+            matrix = parent_matrix @ transformation_matrix(node)
+        finally:
+            self.resolving.discard(path)
+        self.matrices[path] = matrix
+        return matrix
+
+    def resolve_group(self, json_obj, path):
+        """
+        Get the matrix of a group from its depends_on dataset.
+
+        :param json_obj: The group node, e.g. an NXdetector.
+        :param path: The absolute path of the group.
+        """
+        depends_on = get_dataset_values(json_obj, "depends_on")
+        if isinstance(depends_on, list):
+            depends_on = depends_on[0] if depends_on else None
+        return self.resolve(depends_on, path)
+
+
+def get_pixel_offsets(json_obj):
+    """
+    Get the pixel offsets of a detector as an (N, 3) array in metres.
+
+    :param json_obj: The detector group.
+    :return: The offsets, or None if the group has no pixel offsets.
+    """
+    datasets = {}
+    for child in get_child_modules(json_obj):
+        config = child.get("config")
+        if isinstance(config, dict) and config.get("name") in PIXEL_OFFSET_NAMES:
+            scale = get_unit_scale(get_attribute(child, "units"), "m")
+            values = np.asarray(config.get("values"), dtype=float).ravel()
+            datasets[config["name"]] = values * scale
+    if not datasets:
+        return None
+    sizes = {len(values) for values in datasets.values()}
+    if len(sizes) != 1:
+        raise ValueError("Pixel offset datasets differ in length")
+    size = sizes.pop()
+    return np.stack(
+        [datasets.get(name, np.zeros(size)) for name in PIXEL_OFFSET_NAMES], axis=1
+    )
+
+
+def apply_transformation(matrix, points):
+    """
+    Apply a 4x4 matrix to an (N, 3) array of points in one vectorised step.
+    """
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def place_off_geometry(vertices, faces, winding_order, pixel_offsets, matrix):
+    """
+    Instance an OFF shape at every pixel offset and move it into the global frame.
+
+    :param vertices: (V, 3) array of shape vertices.
+    :param faces: (F,) array of face start offsets into winding_order.
+    :param winding_order: (W,) array of vertex indices.
+    :param pixel_offsets: (N, 3) array of pixel offsets, or None for a single shape.
+    :param matrix: The 4x4 transformation matrix of the detector.
+    :return: Tuple (vertices, faces, winding_order) for all N shapes.
+    """
+    if pixel_offsets is not None:
+        pixels = np.arange(len(pixel_offsets))[:, None]
+        faces = (faces[None, :] + pixels * len(winding_order)).ravel()
+        winding_order = (winding_order[None, :] + pixels * len(vertices)).ravel()
+        vertices = (pixel_offsets[:, None, :] + vertices[None, :, :]).reshape(-1, 3)
+    return apply_transformation(matrix, vertices), faces, winding_order
+
+
+def get_picked_node(cell_starts, node_ids, cell_id):
+    """
+    Find the node a picked cell of a merged scene was created from.
+
+    :param cell_starts: Sorted array, cell IDs from cell_starts[i] on belong
+        to node_ids[i] (up to the next start).
+    :param node_ids: The node of every part of the scene, or None.
+    :param cell_id: The picked cell ID.
+    :return: The node ID, or None if the cell belongs to no node.
+    """
+    if cell_id < 0 or len(cell_starts) == 0:
+        return None
+    index = np.searchsorted(cell_starts, cell_id, side="right") - 1
+    return node_ids[index] if index >= 0 else None
+
+
+def diff_json(old, new, at=()):
+    """
+    Describe the difference between two JSON values as a list of small changes.
+
+    Objects are compared key by key and lists are trimmed to the differing
+    middle, so editing one field of a large subtree yields a change of that
+    field only. A change is a dict with "at" (the keys and indices leading to
+    the changed value) and "old"/"new" (missing for an added or removed key),
+    or for a changed run of list items additionally "splice" (the index the
+    run starts at) with the old and new items as lists.
+
+    :param old: The value before the edit.
+    :param new: The value after the edit.
+    :param at: Keys and indices leading to old and new, used when recursing.
+    :return: The list of changes, empty if the values are equal.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = [
+            {"at": [*at, key], "old": value}
+            for key, value in old.items()
+            if key not in new
+        ]
+        for key, value in new.items():
+            if key in old:
+                changes.extend(diff_json(old[key], value, (*at, key)))
+            else:
+                changes.append({"at": [*at, key], "new": value})
+        return changes
+    if isinstance(old, list) and isinstance(new, list):
+        start, old_stop, new_stop = 0, len(old), len(new)
+        while start < min(old_stop, new_stop) and old[start] == new[start]:
+            start += 1
+        while (
+            old_stop > start
+            and new_stop > start
+            and old[old_stop - 1] == new[new_stop - 1]
+        ):
+            old_stop -= 1
+            new_stop -= 1
+        if old_stop - start == new_stop - start == 1:
+            return diff_json(old[start], new[start], (*at, start))
+        if old_stop == new_stop == start:
+            return []
+        return [
+            {
+                "at": list(at),
+                "splice": start,
+                "old": old[start:old_stop],
+                "new": new[start:new_stop],
+            }
+        ]
+    if type(old) is type(new) and old == new:
+        return []
+    return [{"at": list(at), "old": old, "new": new}]
+
+
+def journal_changes(changes):
+    """
+    Strip the old values a replay does not need from changes made by diff_json.
+
+    :param changes: Changes as returned by diff_json.
+    :return: Changes that apply_json_changes can only apply forwards.
+    """
+    stripped = []
+    for change in changes:
+        change = dict(change)
+        old = change.pop("old", None)
+        if "splice" in change:
+            change["remove"] = len(old)
+        stripped.append(change)
+    return stripped
+
+
+def apply_json_changes(json_obj, changes, reverse=False):
+    """
+    Apply changes made by diff_json, modifying json_obj in place.
+
+    :param json_obj: The value the changes were computed against.
+    :param changes: Changes as returned by diff_json or journal_changes.
+    :param reverse: Revert the changes instead, which needs their old values.
+    :return: The changed value, a new object if the value itself was replaced.
+    """
+    old_key, new_key = ("new", "old") if reverse else ("old", "new")
+    for change in reversed(changes) if reverse else changes:
+        at = change["at"]
+        target = json_obj
+        for key in at[:-1] if "splice" not in change else at:
+            target = target[key]
+        if "splice" in change:
+            start = change["splice"]
+            stop = start + (
+                len(change[old_key]) if old_key in change else change["remove"]
+            )
+            target[start:stop] = change[new_key]
+        elif not at:
+            json_obj = change[new_key]
+        elif new_key in change:
+            target[at[-1]] = change[new_key]
+        else:
+            del target[at[-1]]
+    return json_obj
+
+
+def map_unchanged_nodes(changes):
+    """
+    Match the nodes of an edited subtree to the nodes they were before the edit.
+
+    Nodes are addressed by their child-index paths relative to the edited
+    node. A node is unchanged if no change touches its validation view, i.e.
+    its own fields or those of its direct children; its children list may
+    have been spliced though, which shifts the paths of the later siblings.
+
+    :param changes: Changes from diff_json of the edited node.
+    :return: A function mapping the path of a node after the edit to its path
+        before the edit, or to None if the node is new or its view changed.
+    """
+    touched = set()  # Nodes whose own view changed
+    replaced = set()  # Nodes whose subtree is entirely new
+    new_children = set()  # Nodes whose children list was replaced as a whole
+    splices = {}  # Nodes with a run of items replaced in their children list
+    for change in changes:
+        at = change["at"]
+        depth = 0
+        while (
+            depth + 1 < len(at)
+            and at[depth] == "children"
+            and isinstance(at[depth + 1], int)
+        ):
+            depth += 2
+        node_path, rest = tuple(at[1:depth:2]), at[depth:]
+        if not rest:
+            replaced.add(node_path)
+            touched.add(node_path[:-1])
+        elif rest == ["children"]:
+            touched.add(node_path)
+            if "splice" in change:
+                splices[node_path] = (
+                    change["splice"], len(change["old"]), len(change["new"])
+                )
+            else:
+                new_children.add(node_path)
+        else:
+            touched.add(node_path)
+            touched.add(node_path[:-1])
+
+    def get_old_path(new_path):
+        if new_path in touched or new_path in replaced:
+            return None
+        old_path = []
+        for depth, index in enumerate(new_path):
+            parent_path = new_path[:depth]
+            if parent_path in replaced or parent_path in new_children:
+                return None
+            splice = splices.get(parent_path)
+            if splice:
+                start, removed, inserted = splice
+                if start <= index < start + inserted:
+                    return None
+                if index >= start + inserted:
+                    index += removed - inserted
+            old_path.append(index)
+        return tuple(old_path)
+
+    return get_old_path
+
+
+def roots_from_json(json_obj):
+    """
+    Normalise a loaded JSON document into the list of top-level tree nodes.
+
+    :param json_obj: The document as passed to populate_tree.
+    :return: A list with one entry per top-level tree item.
+    """
+    return list(json_obj) if isinstance(json_obj, list) else [json_obj]
+
+
+def get_json_container(roots, path):
+    """
+    Resolve a tree path to the list that holds the addressed node.
+
+    The first path element indexes the top-level nodes, every further element
+    indexes the "children" list of the node above it.
+
+    :param roots: The list of top-level nodes.
+    :param path: List of child indices from the root down to the node.
+    :return: Tuple (list, int) of the containing list and the node's index in it.
+    """
+    container = roots
+    for index in path[:-1]:
+        container = container[index].setdefault("children", [])
+    return container, path[-1]
+
+
+def apply_journal_entry(roots, entry):
+    """
+    Apply a single structural edit from the journal to a list of top-level nodes.
+
+    :param roots: The list of top-level nodes, modified in place.
+    :param entry: The decoded journal record.
+    """
+    op = entry["op"]
+    if op in ("reset", "snapshot"):
+        roots[:] = roots_from_json(entry["data"])
+    else:
+        container, index = get_json_container(roots, entry["path"])
+        if op == "replace":
+            container[index] = entry["data"]
+        elif op == "patch":
+            container[index] = apply_json_changes(container[index], entry["changes"])
+        elif op == "insert":
+            container.insert(index, entry["data"])
+        elif op == "delete":
+            del container[index]
+        else:
+            raise ValueError(f"Unknown journal operation: {op}")
+
+
+def replay_journal(lines):
+    """
+    Rebuild the document from journal lines.
+
+    A torn last line (the process died mid-write) ends the replay instead of
+    failing it, everything before it is still recovered.
+
+    :param lines: Iterable of journal lines.
+    :return: The list of top-level nodes described by the journal.
+    """
+    roots = []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            break
+        apply_journal_entry(roots, entry)
+    return roots
+
+
+def lock_file(path):
+    """
+    Open a lock file and take an exclusive lock on it without blocking.
+
+    The operating system releases the lock when the owning process exits, so
+    a lock that can be taken marks its owner as gone.
+
+    :param path: The lock file, created if it does not exist.
+    :return: The open, locked file, or None if another process holds the lock.
+    """
+    file = open(path, "a+b")
+    try:
+        if fcntl:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        file.close()
+        return None
+    return file
+
+
+def release_lock(file, remove=False):
+    """
+    Release a lock taken with lock_file.
+
+    :param file: The locked file.
+    :param remove: Also delete the lock file.
+    """
+    if remove and fcntl:
+        # Unlink while still locked so nobody takes over the old file
+        os.remove(file.name)
+    file.close()
+    if remove and not fcntl:
+        try:
+            os.remove(file.name)
+        except OSError:
+            pass
+
+
+def get_journal_path(directory=JOURNAL_DIR, pid=None):
+    """
+    Get the journal file of a process, every running instance has its own.
+
+    :param directory: The directory the journals are kept in.
+    :param pid: The process id, the current process by default.
+    :return: The path of the journal file.
+    """
+    return os.path.join(directory, f"session-{pid or os.getpid()}.journal")
+
+
+def find_orphaned_journals(directory=JOURNAL_DIR):
+    """
+    Find the journals left behind by instances that did not shut down cleanly.
+
+    A journal is orphaned when nobody holds its lock file. Empty orphans have
+    nothing to recover and are deleted.
+
+    :param directory: The directory the journals are kept in.
+    :return: The paths of the orphaned journals, the most recent first.
+    """
+    orphans = []
+    for path in glob.glob(os.path.join(glob.escape(directory), "session-*.journal")):
+        lock = lock_file(path + ".lock")
+        if lock is None:
+            continue  # Its instance is still running
+        try:
+            if os.path.getsize(path):
+                orphans.append(path)
+            else:
+                os.remove(path)
+        except OSError:
+            pass  # Claimed and cleaned up by another instance meanwhile
+        release_lock(lock, remove=not os.path.exists(path))
+    return sorted(orphans, key=os.path.getmtime, reverse=True)
+
+
+class EditJournal:
+    """
+    Append-only journal of structural edits used for crash recovery.
+
+    Every edit is serialised on its own, so recording costs the size of the
+    changed values rather than the size of the document. Records are buffered
+    and written with a single fsync per batch, and the file is periodically
+    compacted into a snapshot by a background thread that replays the journal
+    file itself, never touching the live data model.
+
+    The journal holds the lock file path + ".lock" for as long as it is open,
+    see find_orphaned_journals.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pending = []
+        self.records_since_compaction = 0
+        self.compaction_thread = None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock_file = lock_file(path + ".lock")
+        if self.lock_file is None:
+            raise OSError(f"The journal {path} is in use by another process")
+        if os.path.exists(path) and os.path.getsize(path):
+            # Left behind by a crashed process with the same id, keep it for recovery
+            root, ext = os.path.splitext(path)
+            os.replace(path, f"{root}-{time.time_ns()}{ext}")
+        self.file = open(path, "a", encoding="utf-8")
+
+    def record(self, op, **fields):
+        entry = {"op": op, **fields}
+        self.pending.append(json.dumps(entry, separators=(",", ":")) + "\n")
+        self.records_since_compaction += 1
+        if len(self.pending) >= JOURNAL_FSYNC_BATCH:
+            self.flush()
+        if self.records_since_compaction >= JOURNAL_COMPACT_THRESHOLD:
+            self.compact_async()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.lock:
+            self.file.write("".join(self.pending))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.pending.clear()
+
+    def replay(self):
+        self.flush()
+        with open(self.path, "r", encoding="utf-8") as file:
+            return replay_journal(file)
+
+    def reset(self):
+        self.wait_for_compaction()
+        self.pending.clear()
+        with self.lock:
+            self.file.truncate(0)
+        self.records_since_compaction = 0
+
+    def compact_async(self):
+        if self.compaction_thread and self.compaction_thread.is_alive():
+            return
+        self.flush()
+        offset = os.path.getsize(self.path)
+        self.records_since_compaction = 0
+        self.compaction_thread = threading.Thread(
+            target=self._compact, args=(offset,), daemon=True
+        )
+        self.compaction_thread.start()
+
+    def wait_for_compaction(self):
+        if self.compaction_thread:
+            self.compaction_thread.join()
+            self.compaction_thread = None
+
+    def _compact(self, offset):
+        # Fold everything up to offset into one snapshot record. Records
+        # appended meanwhile are copied over verbatim while holding the lock.
+        with open(self.path, "rb") as file:
+            roots = replay_journal(file.read(offset).decode("utf-8").splitlines())
+        compacted_path = self.path + ".compact"
+        with open(compacted_path, "wb") as compacted:
+            snapshot = {"op": "snapshot", "data": roots}
+            compacted.write(
+                json.dumps(snapshot, separators=(",", ":")).encode("utf-8") + b"\n"
+            )
+            with self.lock:
+                with open(self.path, "rb") as file:
+                    file.seek(offset)
+                    compacted.write(file.read())
+                compacted.flush()
+                os.fsync(compacted.fileno())
+                self.file.close()
+                os.replace(compacted_path, self.path)
+                self.file = open(self.path, "a", encoding="utf-8")
+
+    def close(self, discard=False):
+        self.wait_for_compaction()
+        self.flush()
+        self.file.close()
+        if discard:
+            os.remove(self.path)
+        release_lock(self.lock_file, remove=discard)
@@ -0,0 +1,116 @@
+import pytest
+
+from nc_lite_core import FieldIndex, get_index_fields, parse_index_query
+
+
+def stream(module, source, topic):
+    return {"module": module, "config": {"source": source, "topic": topic}}
+
+
+def nx_group(name, nx_class):
+    return {
+        "name": name,
+        "type": "group",
+        "attributes": [{"name": "NX_class", "values": nx_class}],
+        "children": [stream("f144", "child", "motion")],
+    }
+
+
+@pytest.fixture
+def index():
+    index = FieldIndex()
+    index.add(1, stream("f144", "SR:x", "motion"))
+    index.add(2, stream("f144", "SR:y", "motion"))
+    index.add(3, stream("ev44", "det_1", "events"))
+    index.add(4, nx_group("x_motor", "NXpositioner"))
+    index.add(5, nx_group("sample", "NXsample"))
+    return index
+
+
+def test_fields_of_a_single_node():
+    assert get_index_fields(stream("f144", "SR:x", "motion")) == {
+        "module": "f144",
+        "source": "SR:x",
+        "topic": "motion",
+    }
+    assert get_index_fields(nx_group("sample", "NXsample")) == {
+        "name": "sample",
+        "nx_class": "NXsample",
+    }
+    dataset = {"module": "dataset", "config": {"name": "depends_on", "values": "."}}
+    assert get_index_fields(dataset) == {"module": "dataset", "name": "depends_on"}
+    assert get_index_fields({"module": "f144", "config": {"source": ""}}) == {"module": "f144"}
+    assert get_index_fields("text") == {}
+
+
+def test_exact_and_wildcard_lookup(index):
+    assert index.lookup("module", "f144") == {1, 2}
+    assert index.lookup("module", "f1*") == {1, 2}
+    assert index.lookup("source", "SR:?") == {1, 2}
+    assert index.lookup("source", "[ds]*") == {3}
+    assert index.lookup("topic", "nothing") == set()
+
+
+def test_query_intersects_fields(index):
+    assert index.query({"module": "f144", "source": "*y"}) == {2}
+    assert index.query({"module": "ev44", "topic": "motion"}) == set()
+    assert index.query({"nx_class": "NX*", "name": "s*"}) == {5}
+    assert index.query({}) == set()
+
+
+def test_readding_a_node_replaces_its_postings(index):
+    index.add(2, stream("f144", "SR:z", "motion"))
+    assert index.lookup("source", "SR:y") == set()
+    assert "SR:y" not in index.postings["source"]
+    assert index.lookup("source", "SR:z") == {2}
+    assert index.lookup("module", "f144") == {1, 2}
+
+
+def test_removed_nodes_leave_no_postings(index):
+    index.remove(3)
+    index.remove(3)
+    assert index.lookup("module", "ev44") == set()
+    assert "ev44" not in index.postings["module"]
+    assert "det_1" not in index.postings["source"]
+    assert 3 not in index.node_fields
+    index.add(6, stream("ev44", "det_2", "events"))
+    assert index.query(parse_index_query("writer=ev44")) == {6}
+
+
+def test_clear(index):
+    index.clear()
+    assert index.query({"module": "*"}) == set()
+    assert index.node_fields == {}
+
+
+def test_parse_query():
+    assert parse_index_query("module=f144 topic=motion") == {
+        "module": "f144",
+        "topic": "motion",
+    }
+    assert parse_index_query("class=NXlog Writer=f144") == {
+        "nx_class": "NXlog",
+        "module": "f144",
+    }
+    assert parse_index_query("nxclass=NXsample") == {"nx_class": "NXsample"}
+    assert parse_index_query("'x motor*'") == {"name": "x motor*"}
+    assert parse_index_query('source="SR: x"') == {"source": "SR: x"}
+    assert parse_index_query("") == {}
+
+
+def test_bare_term_matches_name(index):
+    assert index.query(parse_index_query("x_*")) == {4}
+    assert index.query(parse_index_query("sample class=NXsample")) == {5}
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ("colour=red", "Unknown field 'colour'"),
+        ("module=f144 'topic=motion", "No closing quotation"),
+        ('source="SR:x', "No closing quotation"),
+    ],
+)
+def test_invalid_queries(text, message):
+    with pytest.raises(ValueError, match=message):
+        parse_index_query(text)
@@ -0,0 +1,137 @@
+import copy
+import json
+
+import pytest
+
+from nc_lite_core import (EditJournal, apply_json_changes, diff_json,
+                          find_orphaned_journals, get_journal_path,
+                          journal_changes, replay_journal)
+
+
+def read_roots(journal):
+    journal.flush()
+    with open(journal.path, "r", encoding="utf-8") as file:
+        return replay_journal(file)
+
+
+def test_replay_of_loaded_document_does_not_depend_on_the_file(tmp_path):
+    document_file = tmp_path / "doc.json"
+    document = {"children": [{"name": "a"}, {"name": "b"}, {"name": "c"}]}
+    document_file.write_text(json.dumps(document))
+
+    journal = EditJournal(str(tmp_path / "session.journal"))
+    journal.record("reset", data=json.loads(document_file.read_text()))
+    journal.record("delete", path=[0, 1])
+    # Saving over the opened file must not make replay delete a second node
+    document_file.write_text(json.dumps({"children": [{"name": "a"}, {"name": "c"}]}))
+
+    assert read_roots(journal) == [{"children": [{"name": "a"}, {"name": "c"}]}]
+    journal.close(discard=True)
+
+
+def test_torn_last_line_is_ignored():
+    lines = [
+        json.dumps({"op": "reset", "data": {"children": []}}),
+        json.dumps({"op": "insert", "path": [0, 0], "data": {"name": "x"}}),
+        '{"op": "insert", "path": [0, 1], "da',
+    ]
+    assert replay_journal(lines) == [{"children": [{"name": "x"}]}]
+
+
+def test_patch_records_only_the_changed_values(tmp_path):
+    old = {
+        "name": "entry",
+        "children": [
+            {"name": "a", "config": {"topic": "t1"}},
+            {"name": "b", "values": list(range(1000))},
+        ],
+    }
+    new = copy.deepcopy(old)
+    new["children"][0]["config"]["topic"] = "t2"
+    changes = diff_json(old, new)
+    assert changes == [{"at": ["children", 0, "config", "topic"], "old": "t1", "new": "t2"}]
+
+    journal = EditJournal(str(tmp_path / "session.journal"))
+    journal.record("reset", data=old)
+    journal.record("patch", path=[0], changes=journal_changes(changes))
+    journal.flush()
+    with open(journal.path, encoding="utf-8") as file:
+        assert len(file.readlines()[-1]) < 100
+    assert read_roots(journal) == [new]
+    journal.close(discard=True)
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        ({"a": 1, "b": [1, 2, 3]}, {"a": 1, "b": [1, 2, 3, 4], "c": None}),
+        ({"a": 1, "b": 2}, {"b": 2}),
+        ([1, 2, 3, 4, 5], [1, 9, 9, 5]),
+        ([1, 2, 3], []),
+        ([], [{"a": 1}]),
+        ([{"a": [1, 2]}, "x"], [{"a": [1, 3]}, "x"]),
+        ("text", {"name": "text"}),
+        (1, 1.0),
+        ({"children": ["a", "b", "c"]}, {"children": ["a", "c"]}),
+    ],
+)
+def test_changes_apply_forwards_and_backwards(old, new):
+    changes = diff_json(old, new)
+    forward = apply_json_changes(copy.deepcopy(old), journal_changes(changes))
+    assert forward == new and type(forward) is type(new)
+    changed = apply_json_changes(copy.deepcopy(old), copy.deepcopy(changes))
+    assert apply_json_changes(changed, changes, reverse=True) == old
+
+
+def test_equal_values_have_no_changes():
+    document = {"name": "entry", "children": [{"name": "a", "values": [1, 2]}]}
+    assert diff_json(document, copy.deepcopy(document)) == []
+
+
+def test_running_instances_keep_their_journals(tmp_path):
+    running = EditJournal(get_journal_path(str(tmp_path), pid=1))
+    running.record("reset", data={"name": "running"})
+    running.flush()
+    crashed = EditJournal(get_journal_path(str(tmp_path), pid=2))
+    crashed.record("reset", data={"name": "crashed"})
+    crashed.close()  # Leaves the journal behind like a crash
+    closed = EditJournal(get_journal_path(str(tmp_path), pid=3))
+    closed.record("reset", data={"name": "closed"})
+    closed.close(discard=True)
+
+    assert find_orphaned_journals(str(tmp_path)) == [crashed.path]
+    with pytest.raises(OSError):
+        EditJournal(running.path)
+    assert read_roots(running) == [{"name": "running"}]
+    running.close(discard=True)
+    assert find_orphaned_journals(str(tmp_path)) == [crashed.path]
+
+
+def test_journal_of_a_crashed_process_with_the_same_id_is_kept(tmp_path):
+    path = get_journal_path(str(tmp_path), pid=1)
+    crashed = EditJournal(path)
+    crashed.record("reset", data={"name": "crashed"})
+    crashed.close()
+
+    journal = EditJournal(path)
+    orphans = find_orphaned_journals(str(tmp_path))
+    assert len(orphans) == 1 and orphans[0] != path
+    with open(orphans[0], encoding="utf-8") as file:
+        assert replay_journal(file) == [{"name": "crashed"}]
+    journal.close(discard=True)
+
+
+def test_compaction_keeps_the_document(tmp_path):
+    journal = EditJournal(str(tmp_path / "session.journal"))
+    journal.record("reset", data={"name": "entry", "children": []})
+    for index in range(10):
+        journal.record("insert", path=[0, index], data={"name": str(index)})
+    journal.compact_async()
+    journal.record("delete", path=[0, 0])
+    journal.wait_for_compaction()
+
+    expected = [{"name": "entry", "children": [{"name": str(i)} for i in range(1, 10)]}]
+    assert read_roots(journal) == expected
+    with open(journal.path, encoding="utf-8") as file:
+        assert len(file.readlines()) == 2
+    journal.close(discard=True)
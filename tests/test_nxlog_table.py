@@ -0,0 +1,47 @@
+import pytest
+
+from nc_lite_core import parse_nxlog_table
+
+
+def test_rows_without_header_use_the_column_order():
+    rows = parse_nxlog_table("temp\tf144\tsrc\ttopic\tK\npressure\tf144\tsrc2\ttopic\n")
+    assert rows == [
+        {"name": "temp", "module": "f144", "source": "src", "topic": "topic", "units": "K"},
+        {"name": "pressure", "module": "f144", "source": "src2", "topic": "topic", "units": ""},
+    ]
+
+
+def test_header_selects_the_columns():
+    rows = parse_nxlog_table("topic;name;source;module\nt;temp;src;f144\n")
+    assert rows == [
+        {"name": "temp", "module": "f144", "source": "src", "topic": "t", "units": ""}
+    ]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "a\tf144\tS:1,2\tt\n",
+        "name\tmodule\tsource\ttopic\na\tf144\tS:1,2\tt\n",
+        "a;f144;S:1,2;t\nb;f144;S:3,4;t\n",
+        'a,f144,"S:1,2",t\n',
+    ],
+)
+def test_cells_may_contain_other_delimiters(text):
+    assert parse_nxlog_table(text)[0] == {
+        "name": "a", "module": "f144", "source": "S:1,2", "topic": "t", "units": ""
+    }
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ("name,module,source\ntemp,f144,src\n", "header has no topic"),
+        ("temp,f144,src,topic\npressure,f144\n", "Row 2 has no source, topic"),
+        ("name,module,source,topic\ntemp,,src,topic\n", "Row 2 has no module"),
+        ("temp,f144,src,topic,K,extra\n", "Row 1 has more than 5 columns"),
+    ],
+)
+def test_incomplete_rows_are_rejected(text, message):
+    with pytest.raises(ValueError, match=message):
+        parse_nxlog_table(text)
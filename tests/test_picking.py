@@ -0,0 +1,16 @@
+import numpy as np
+
+from nc_lite_core import get_picked_node
+
+
+def test_cell_is_mapped_to_the_part_it_starts_in():
+    cell_starts = np.array([0, 4, 4, 10])
+    node_ids = ["a", "empty", "b", None]
+    picked = [get_picked_node(cell_starts, node_ids, cell_id) for cell_id in range(12)]
+    assert picked == ["a"] * 4 + ["b"] * 6 + [None] * 2
+
+
+def test_missed_pick_has_no_node():
+    assert get_picked_node(np.array([0]), ["a"], -1) is None
+    assert get_picked_node(np.array([], dtype=np.int64), [], 0) is None
+    assert get_picked_node(np.array([2]), ["a"], 1) is None
@@ -0,0 +1,112 @@
+import io
+import json
+
+import pytest
+
+from nc_lite_core import (MAX_JSON_TOKEN_LEN, iter_json_tokens,
+                          iter_text_chunks, reformat_json)
+
+DOCUMENT = {
+    "name": "entry",
+    "escaped": "quote \" backslash \\ comma , bracket ] brace } unicode é",
+    "controls": "\b\f\n\r\t\x01 / \U0001f600",
+    "empty_list": [],
+    "empty_object": {},
+    "numbers": [1, -2.5, 3e-7, 0, 1e100],
+    "literals": [True, False, None],
+    "nested": [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]],
+    "objects": [{"a": 1}, {"b": [{"c": "d"}]}],
+    "long": list(range(500)),
+}
+
+
+def reformat(text, chunk_size=7, **kwargs):
+    output = io.StringIO()
+    reformat_json(iter_text_chunks(text, chunk_size), output.write, **kwargs)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1 << 16])
+def test_expanded_style_matches_json_dumps(chunk_size):
+    text = json.dumps(DOCUMENT)
+    assert reformat(text, chunk_size) == json.dumps(DOCUMENT, indent=4)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 16])
+def test_compact_style_round_trips(chunk_size):
+    text = json.dumps(DOCUMENT, indent=4)
+    assert json.loads(reformat(text, chunk_size, compact_arrays=True)) == DOCUMENT
+
+
+def test_compact_style_keeps_short_arrays_inline():
+    formatted = reformat(json.dumps(DOCUMENT), compact_arrays=True)
+    assert '"nested": [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]],' in formatted
+    assert '"empty_list": [],' in formatted
+
+
+def test_compact_style_wraps_long_arrays():
+    formatted = reformat(json.dumps({"values": list(range(10_000))}), compact_arrays=True)
+    lines = formatted.splitlines()
+    assert max(len(line) for line in lines) <= 100
+    assert len(lines) < 10_000 // 10
+    assert json.loads(formatted) == {"values": list(range(10_000))}
+
+
+def test_compact_style_fills_short_arrays_into_lines():
+    vertices = [[i * 0.5, -i * 0.25, float(i % 7)] for i in range(10_000)]
+    document = {"vertices": vertices, "mixed": [[1, 2], [list(range(40))] * 2, 3, [4, 5]]}
+    formatted = reformat(json.dumps(document), compact_arrays=True)
+    lines = formatted.splitlines()
+    assert max(len(line) for line in lines) <= 100
+    assert len(lines) < 10_000 // 3
+    assert lines[2].startswith("        [0.0, 0.0, 0.0], [0.5, -0.25, 1.0], [1.0, -0.5, 2.0], ")
+    assert json.loads(formatted) == document
+
+
+def test_iterencode_chunks_can_be_reformatted():
+    output = io.StringIO()
+    reformat_json(json.JSONEncoder().iterencode(DOCUMENT), output.write, indent=2)
+    assert output.getvalue() == json.dumps(DOCUMENT, indent=2)
+
+
+def test_tokens_split_across_chunks():
+    tokens = list(iter_json_tokens(["[12", "34, \"a", "b\\", "\"c\", tr", "ue]"]))
+    assert [text for _, text, _ in tokens] == ["[", "1234", ",", '"ab\\"c"', ",", "true", "]"]
+
+
+@pytest.mark.parametrize("compact_arrays", [False, True])
+def test_strings_longer_than_the_token_limit(compact_arrays):
+    document = {"long": "x" * (2 * MAX_JSON_TOKEN_LEN), "values": [1, 2]}
+    # iterencode yields the long string as one chunk ending at its quote
+    output = io.StringIO()
+    reformat_json(
+        json.JSONEncoder().iterencode(document), output.write, compact_arrays=compact_arrays
+    )
+    assert json.loads(output.getvalue()) == document
+    # Split over many chunks, as the editor text is for autoformat
+    assert json.loads(reformat(json.dumps(document), 1 << 16)) == document
+
+
+def test_unterminated_literal_is_limited():
+    chunks = iter_text_chunks("[" + "1" * (MAX_JSON_TOKEN_LEN + 10), 1 << 16)
+    with pytest.raises(ValueError, match="unterminated"):
+        list(iter_json_tokens(chunks))
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '{"a": 1,}', "[1 2]", '{"a" 1}', "[1,", '"abc', "{1: 2}", "[01]", "[1]]", "tru",
+        "[nan]", r'{"a": "\q"}', r'["\u12g4"]', r'["\x41"]',
+    ],
+)
+def test_invalid_json_is_rejected(text):
+    with pytest.raises(ValueError):
+        reformat(text)
+
+
+def test_python_json_dialect_is_accepted():
+    text = json.dumps({"values": [float("nan"), float("inf"), -float("inf")]})
+    assert reformat(text, compact_arrays=True) == (
+        '{\n    "values": [NaN, Infinity, -Infinity]\n}'
+    )
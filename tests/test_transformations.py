@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+
+from nc_lite_core import (TransformationResolver, apply_transformation,
+                          get_pixel_offsets, place_off_geometry,
+                          transformation_matrix)
+
+
+def dataset(name, values, **attributes):
+    return {
+        "module": "dataset",
+        "config": {"name": name, "values": values},
+        "attributes": [{"name": key, "values": value} for key, value in attributes.items()],
+    }
+
+
+def group(name, *children):
+    return {"name": name, "type": "group", "children": list(children)}
+
+
+def make_document(detector_depends_on="../transformations/rotation", **rotation):
+    rotation_attributes = {
+        "transformation_type": "rotation",
+        "vector": [0, 0, 1],
+        "units": "deg",
+        "offset": [0, 0, 1],
+        "depends_on": "stage",
+    }
+    rotation_attributes.update(rotation)
+    return group(
+        "entry",
+        group(
+            "instrument",
+            group(
+                "transformations",
+                dataset(
+                    "stage", 100, transformation_type="translation",
+                    vector=[1, 0, 0], units="mm", depends_on=".",
+                ),
+                dataset("rotation", 90, **rotation_attributes),
+            ),
+            group(
+                "detector",
+                dataset("depends_on", detector_depends_on),
+                dataset("x_pixel_offset", [0, 10], units="mm"),
+                dataset("y_pixel_offset", [0, 0], units="mm"),
+            ),
+        ),
+    )
+
+
+DETECTOR_PATH = "/entry/instrument/detector"
+
+
+def resolve_detector(document):
+    detector = document["children"][0]["children"][1]
+    return TransformationResolver([document]).resolve_group(detector, DETECTOR_PATH)
+
+
+def test_translation_converts_units():
+    node = dataset("x", 100, transformation_type="translation", vector=[0, 2, 0], units="mm")
+    assert np.allclose(transformation_matrix(node)[:3, 3], [0, 0.1, 0])
+
+
+def test_offset_is_applied_after_the_rotation():
+    matrix = transformation_matrix(make_document()["children"][0]["children"][0]["children"][1])
+    point = apply_transformation(matrix, np.array([[1.0, 0, 0]]))
+    assert np.allclose(point, [[0, 1, 1]])
+
+
+def test_chain_is_applied_from_the_detector_outwards():
+    matrix = resolve_detector(make_document())
+    # Rotated, then offset by the rotation, then translated by the stage
+    point = apply_transformation(matrix, np.array([[1.0, 0, 0]]))
+    assert np.allclose(point, [[0.1, 1, 1]])
+
+
+def test_absolute_depends_on_and_offset_units():
+    document = make_document(
+        "/entry/instrument/transformations/rotation",
+        offset=[0, 0, 500], offset_units="mm", units="rad",
+    )
+    document["children"][0]["children"][0]["children"][1]["config"]["values"] = np.pi
+    point = apply_transformation(resolve_detector(document), np.array([[1.0, 0, 0]]))
+    assert np.allclose(point, [[-0.9, 0, 0.5]])
+
+
+def test_shared_chain_is_resolved_once():
+    resolver = TransformationResolver([make_document()])
+    first = resolver.resolve("../transformations/rotation", "/entry/instrument/detector_1")
+    assert "/entry/instrument/transformations/stage" in resolver.matrices
+    resolver.nodes.clear()  # A second resolution must come from the memo
+    second = resolver.resolve("../../transformations/rotation", "/entry/instrument/x/y")
+    assert second is first
+
+
+@pytest.mark.parametrize(
+    "depends_on, message",
+    [
+        ("../transformations/missing", "does not exist"),
+        ("../transformations/rotation", "cycle"),
+    ],
+)
+def test_broken_chains_raise(depends_on, message):
+    document = make_document(depends_on)
+    stage = document["children"][0]["children"][0]["children"][0]
+    stage["attributes"][-1]["values"] = "rotation"
+    with pytest.raises(ValueError, match=message):
+        resolve_detector(document)
+
+
+def test_pixel_offsets_fill_missing_axes():
+    detector = make_document()["children"][0]["children"][1]
+    assert np.allclose(get_pixel_offsets(detector), [[0, 0, 0], [0.01, 0, 0]])
+    del detector["children"][2]
+    assert np.allclose(get_pixel_offsets(detector), [[0, 0, 0], [0.01, 0, 0]])
+    detector["children"][1]["config"]["values"] = [0]
+    detector["children"].append(dataset("z_pixel_offset", [0, 0]))
+    with pytest.raises(ValueError):
+        get_pixel_offsets(detector)
+
+
+def test_shape_is_instanced_at_every_pixel():
+    vertices = np.array([[0.0, 0, 0], [1, 0, 0], [0, 1, 0]])
+    faces = np.array([0])
+    winding_order = np.array([0, 1, 2])
+    pixel_offsets = np.array([[0.0, 0, 0], [10, 0, 0]])
+    matrix = np.eye(4)
+    matrix[:3, 3] = [0, 0, 5]
+
+    placed, placed_faces, placed_winding = place_off_geometry(
+        vertices, faces, winding_order, pixel_offsets, matrix
+    )
+    assert np.allclose(placed[3:], vertices + [10, 0, 5])
+    assert placed_faces.tolist() == [0, 3]
+    assert placed_winding.tolist() == [0, 1, 2, 3, 4, 5]
+
+    single, _, _ = place_off_geometry(vertices, faces, winding_order, None, matrix)
+    assert np.allclose(single, vertices + [0, 0, 5])
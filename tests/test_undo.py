@@ -0,0 +1,79 @@
+import copy
+import json
+
+from nc_lite_core import UndoHistory, apply_json_changes, diff_json
+
+
+def patch(history, old, new, path=(0,)):
+    return history.push("patch", list(path), diff_json(old, new))
+
+
+def test_patch_stores_only_the_changes():
+    history = UndoHistory()
+    old = {"name": "entry", "values": list(range(10000))}
+    new = copy.deepcopy(old)
+    new["values"][5000] = -1
+    assert patch(history, old, new)
+    assert history.size < 100
+
+
+def test_undo_and_redo_restore_the_node():
+    history = UndoHistory(coalesce_seconds=0)
+    old = {"name": "entry", "children": [{"name": "a"}]}
+    new = {"name": "renamed", "children": [{"name": "a"}, {"name": "b"}]}
+    patch(history, old, new)
+
+    delta = history.undo()
+    changes = [json.loads(change) for change in delta["data"]]
+    assert apply_json_changes(copy.deepcopy(new), changes, reverse=True) == old
+    assert history.redo() is delta
+    assert apply_json_changes(copy.deepcopy(old), changes) == new
+
+
+def test_quick_patches_of_one_node_are_merged():
+    history = UndoHistory(coalesce_seconds=60)
+    patch(history, {"name": "a"}, {"name": "ab"})
+    patch(history, {"name": "ab"}, {"name": "abc"})
+    patch(history, {"name": "x"}, {"name": "y"}, path=(1,))
+    assert [len(delta["data"]) for delta in history.undo_stack] == [2, 1]
+
+
+def test_oldest_deltas_are_evicted_but_never_the_newest():
+    history = UndoHistory(memory_budget=100, coalesce_seconds=0)
+    for index in range(10):
+        assert history.push("insert", [index], {"name": "x" * 20})
+    assert 1 < len(history.undo_stack) < 10
+    assert history.undo_stack[-1]["path"] == [9]
+    assert history.size <= 100
+
+
+def test_oversized_delta_clears_the_history_and_is_reported():
+    history = UndoHistory(memory_budget=100, coalesce_seconds=0)
+    history.push("insert", [0], {"name": "small"})
+    assert not history.push("insert", [1], {"name": "x" * 200})
+    assert history.undo() is None
+    assert history.push("insert", [1], {"name": "small"})
+    assert history.undo()["path"] == [1]
+
+
+def test_groups_are_undone_as_one_step():
+    history = UndoHistory(memory_budget=100)
+    history.begin_group()
+    history.push("insert", [0], "a")
+    history.push("insert", [1], "b")
+    assert history.end_group()
+    delta = history.undo()
+    assert delta["op"] == "group"
+    assert [member["path"] for member in delta["deltas"]] == [[0], [1]]
+
+    history.begin_group()
+    history.push("insert", [0], "x" * 200)
+    assert not history.end_group()
+    assert history.undo() is None
+
+
+def test_delete_without_data_cannot_be_undone():
+    history = UndoHistory()
+    history.push("insert", [0], "a")
+    assert not history.push("delete", [0], None)
+    assert history.undo() is None
@@ -0,0 +1,160 @@
+import copy
+
+import pytest
+
+from nc_lite_core import (ValidationEngine, diff_json, map_unchanged_nodes,
+                          validation_view)
+
+
+def group(name, *children, **fields):
+    return {"name": name, "type": "group", **fields, "children": list(children)}
+
+
+DOCUMENT = group(
+    "entry",
+    group("a", group("a0"), group("a1")),
+    group("b", group("b0", values=list(range(100)))),
+    group("c"),
+)
+
+
+def map_paths(edit, paths):
+    new = copy.deepcopy(DOCUMENT)
+    edit(new)
+    get_old_path = map_unchanged_nodes(diff_json(DOCUMENT, new))
+    return [get_old_path(path) for path in paths]
+
+
+def test_field_change_touches_the_node_and_its_parent():
+    def edit(document):
+        document["children"][1]["children"][0]["values"][5] = -1
+
+    paths = [(), (0,), (0, 1), (1,), (1, 0), (2,)]
+    assert map_paths(edit, paths) == [(), (0,), (0, 1), None, None, (2,)]
+
+
+def test_inserted_child_shifts_later_siblings():
+    def edit(document):
+        document["children"].insert(1, group("x"))
+
+    paths = [(), (0,), (0, 1), (1,), (2,), (2, 0), (3,)]
+    assert map_paths(edit, paths) == [None, (0,), (0, 1), None, (1,), (1, 0), (2,)]
+
+
+def test_removed_child_shifts_later_siblings():
+    def edit(document):
+        del document["children"][0]
+
+    assert map_paths(edit, [(0,), (0, 0), (1,)]) == [(1,), (1, 0), (2,)]
+
+
+def test_replaced_subtree_is_new():
+    def edit(document):
+        document["children"][0] = "a"
+
+    assert map_paths(edit, [(0,), (1,)]) == [None, (1,)]
+
+    def edit(document):
+        document["children"][0]["children"] = {"name": "a0"}
+
+    assert map_paths(edit, [(0,), (0, 0), (1,)]) == [None, None, (1,)]
+
+
+def nx_group(name, nx_class, *children):
+    node = group(name, *children)
+    node["attributes"] = [{"name": "NX_class", "values": nx_class}]
+    return node
+
+
+def dataset(name, values):
+    return {"module": "dataset", "config": {"name": name, "values": values}}
+
+
+def validate(*nodes):
+    batch = [(index, validation_view(node)) for index, node in enumerate(nodes)]
+    return ValidationEngine().run(batch)
+
+
+def messages(problems):
+    return [message for _, message in problems]
+
+
+def test_stream_module_needs_source_and_topic():
+    results = validate(
+        {"module": "f144", "config": {"source": "SR:1", "topic": "motion"}},
+        {"module": "f144", "config": {"source": " ", "dtype": "double"}},
+    )
+    assert results[0] == []
+    assert messages(results[1]) == [
+        "Module 'f144' is missing 'source'",
+        "Module 'f144' is missing 'topic'",
+    ]
+
+
+def test_unknown_module_and_missing_config():
+    results = validate({"module": "xyz1"}, dataset("x", None))
+    assert messages(results[0]) == ["Unknown module 'xyz1'", "Module has no 'config' object"]
+    assert messages(results[1]) == ["Module 'dataset' is missing 'values'"]
+
+
+def test_group_checks():
+    results = validate(group("sample"), nx_group("log", "NXlog"))
+    assert results[0] == [("warning", "Group has no NX_class attribute")]
+    assert messages(results[1]) == [
+        "NXlog has neither a stream module nor a 'value' dataset"
+    ]
+
+
+@pytest.mark.parametrize(
+    "faces, winding_order, message",
+    [
+        ([0, 3], [0, 1, 2, 1, 2, 3], None),
+        ([0, 4], [0, 1, 2, 1, 2, 3], "OFF faces/winding_order mismatch"),
+        ([1], [0, 1, 2], "OFF faces/winding_order mismatch"),
+        ([0], [0, 1, 4], "OFF winding_order refers to vertices"),
+        ([], [], "OFF geometry has no faces"),
+    ],
+)
+def test_off_geometry_faces_must_partition_the_winding_order(faces, winding_order, message):
+    shape = nx_group(
+        "pixel_shape",
+        "NXoff_geometry",
+        dataset("vertices", [[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 1, 0]]),
+        dataset("faces", faces),
+        dataset("winding_order", winding_order),
+    )
+    problems = messages(validate(shape)[0])
+    if message is None:
+        assert problems == []
+    else:
+        assert len(problems) == 1 and problems[0].startswith(message)
+
+
+def test_off_geometry_missing_datasets():
+    shape = nx_group("shape", "NXoff_geometry", dataset("vertices", [[0, 0, 0]]))
+    assert messages(validate(shape)[0]) == ["OFF geometry is missing faces, winding_order"]
+
+
+def test_unchanged_content_is_answered_from_the_memo():
+    calls = []
+
+    def check(json_obj):
+        calls.append(json_obj["config"]["source"])
+        return []
+
+    engine = ValidationEngine(rules=[(("module",), check)])
+    module = {"module": "f144", "config": {"source": "a", "topic": "t"}}
+    engine.run([(1, module), (2, copy.deepcopy(module))])
+    assert calls == ["a"]
+
+    changed = copy.deepcopy(module)
+    changed["config"]["source"] = "b"
+    assert engine.run([(1, module), (2, changed)]) == {1: [], 2: []}
+    assert calls == ["a", "b"]
+
+
+def test_view_strips_grandchildren_only():
+    node = group("a", group("b", group("c")))
+    view = validation_view(node)
+    assert view["children"] == [{"name": "b", "type": "group"}]
+    assert node["children"][0]["children"] == [group("c")]